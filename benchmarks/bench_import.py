@@ -0,0 +1,24 @@
+import subprocess
+import sys
+
+# optional dependencies that must stay off the runtime path
+HEAVY_MODULES = ['matplotlib', 'networkx', 'tabulate', 'tqdm', 'gymnasium']
+
+class Import:
+    '''
+    cold-start cost of the modules every evaluation worker and inference process loads,
+    each timed in a fresh interpreter
+    '''
+
+    params = ['sneat', 'sneat.genome', 'sneat.evaluator', 'sneat.runtime', 'sneat.evolve']
+    param_names = ['module']
+
+    def timeraw_import(self, module):
+        return f'import {module}'
+
+    def track_heavy_modules(self, module):
+        # the number of heavy optional dependencies pulled in, which should stay at zero
+        code = f'import sys, {module}; print(sum(m in sys.modules for m in {HEAVY_MODULES!r}))'
+        return int(subprocess.check_output([sys.executable, '-c', code]))
+
+    track_heavy_modules.unit = 'modules'
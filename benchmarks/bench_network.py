@@ -0,0 +1,122 @@
+import numpy as np
+from sneat import codegen
+from sneat.config import get_config
+from sneat.population import Population
+from sneat.neuralnetwork import Connection
+from .generators import make_genome
+
+NODES = [10, 100, 500, 2000]
+
+def genome_with(num_nodes, seed=0):
+    np.random.seed(seed)
+    pop = Population(initialize=False, config=get_config().override({'NeuralNetwork': {'num_inputs': 4, 'num_outputs': 2}}))
+    return pop, make_genome(pop, num_nodes)
+
+class FeedForward:
+    params = NODES
+    param_names = ['nodes']
+
+    def setup(self, num_nodes):
+        self.pop, self.genome = genome_with(num_nodes)
+        self.inputs = list(np.random.uniform(-1, 1, 4))
+        self.batch = np.random.uniform(-1, 1, (64, 4))
+        self.genome.activate(self.inputs) # compile the plan outside the timing
+
+    def time_feed_forward(self, num_nodes):
+        self.genome.activate(self.inputs)
+
+    def time_activate_batch(self, num_nodes):
+        self.genome.activate_batch(self.batch)
+
+    def time_compile_plan(self, num_nodes):
+        self.genome.network.invalidate_plan()
+        self.genome.network.get_plan()
+
+class Codegen:
+    params = [10, 40, 100, 500]
+    param_names = ['nodes']
+
+    def setup(self, num_nodes):
+        self.pop, self.genome = genome_with(num_nodes)
+        self.compiled = self.genome.clone()
+        self.compiled.network.backend = 'codegen'
+        self.inputs = list(np.random.uniform(-1, 1, 4))
+        self.genome.activate(self.inputs) # compile both outside the timing
+        self.compiled.activate(self.inputs)
+
+    def time_feed_forward_plan(self, num_nodes):
+        self.genome.activate(self.inputs)
+
+    def time_feed_forward_codegen(self, num_nodes):
+        self.compiled.activate(self.inputs)
+
+    def time_compile(self, num_nodes):
+        codegen.cache.clear()
+        self.compiled.network.compiled = None
+        self.compiled.network.get_compiled()
+
+class Step:
+    params = NODES
+    param_names = ['nodes']
+
+    def setup(self, num_nodes):
+        self.pop, self.genome = genome_with(num_nodes)
+        network = self.genome.network
+
+        # one recurrent connection for every ten nodes, back from a hidden or output node
+        sources = [n for n in network.nodes if n.node_type != 'input']
+        targets = [n for n in network.nodes if n.node_type == 'hidden'] or sources
+        existing = {(c.in_node.id, c.out_node.id) for c in network.connections}
+        for i, j in zip(np.random.randint(len(sources), size=max(num_nodes // 10, 1)), np.random.randint(len(targets), size=max(num_nodes // 10, 1))):
+            if (sources[i].id, targets[j].id) not in existing:
+                existing.add((sources[i].id, targets[j].id))
+                innovation_number = self.pop.callbacks['find_or_create_innovation'](sources[i], targets[j])
+                network.connections.append(Connection(innovation_number, sources[i], targets[j], recurrent=True))
+        network.adjacency = None
+        network.invalidate_plan()
+
+        self.inputs = np.random.uniform(-1, 1, 4)
+        self.batch = np.random.uniform(-1, 1, (64, 4))
+        self.batched = self.genome.clone()
+        self.genome.step(self.inputs) # compile the plan and allocate the state outside the timing
+        self.batched.step(self.batch)
+
+    def time_step(self, num_nodes):
+        self.genome.step(self.inputs)
+
+    def time_step_batch(self, num_nodes):
+        self.batched.step(self.batch)
+
+    def time_compile_recurrent_plan(self, num_nodes):
+        self.genome.network.recurrent_plan = None
+        self.genome.network.get_recurrent_plan()
+
+class Clone:
+    params = NODES
+    param_names = ['nodes']
+
+    def setup(self, num_nodes):
+        self.pop, self.genome = genome_with(num_nodes)
+
+    def time_clone(self, num_nodes):
+        self.genome.clone()
+
+    def peakmem_clone(self, num_nodes):
+        self.genome.clone()
+
+class CycleCheck:
+    params = NODES
+    param_names = ['nodes']
+
+    def setup(self, num_nodes):
+        self.pop, self.genome = genome_with(num_nodes)
+        network = self.genome.network
+        sources = [n for n in network.nodes if n.node_type != 'output']
+        targets = [n for n in network.nodes if n.node_type != 'input']
+        self.pairs = [(sources[i], targets[j]) for i, j in zip(np.random.randint(len(sources), size=100), np.random.randint(len(targets), size=100))]
+        network.get_adjacency()
+
+    def time_would_create_cycle(self, num_nodes):
+        # 100 random queries
+        for in_node, out_node in self.pairs:
+            self.genome.network.would_create_cycle(in_node, out_node)
@@ -0,0 +1,67 @@
+import numpy as np
+from sneat.population import Population
+from .generators import fresh_population, perturbed, fitness
+
+POPULATION_SIZES = [150, 1000, 10000]
+
+class GeneticDistance:
+    params = [10, 100, 500, 2000]
+    param_names = ['nodes']
+
+    def setup(self, num_nodes):
+        pop = fresh_population(2, num_nodes, num_species=2, num_inputs=4, num_outputs=2)
+        self.g1, self.g2 = pop.genomes
+
+    def time_measure_genetic_distance(self, num_nodes):
+        Population.measure_genetic_distance(self.g1, self.g2)
+
+class Speciate:
+    params = (POPULATION_SIZES, [5, 20])
+    param_names = ['population_size', 'species']
+    number = 1 # speciating changes the population, so every call gets a fresh one from setup
+    repeat = 5
+    warmup_time = 0
+    timeout = 300
+
+    def setup(self, population_size, num_species):
+        self.pop = fresh_population(population_size, 50, num_species)
+        self.offspring = [perturbed(self.pop, g) for g in self.pop.genomes]
+
+    def time_speciate(self, population_size, num_species):
+        self.pop.speciate(self.offspring)
+
+class Reproduce:
+    params = POPULATION_SIZES
+    param_names = ['population_size']
+    number = 1
+    repeat = 5
+    warmup_time = 0
+    timeout = 600
+
+    def setup(self, population_size):
+        self.pop = fresh_population(population_size, 50, 10)
+
+    def time_reproduce(self, population_size):
+        self.pop.reproduce()
+
+class Generation:
+    '''
+    one full generation - evaluation with a cheap deterministic fitness function, then
+    reproduction - in a single process, so the numbers don't depend on a worker pool
+    '''
+
+    params = [150, 1000]
+    param_names = ['population_size']
+    number = 1
+    repeat = 5
+    warmup_time = 0
+    timeout = 300
+
+    def setup(self, population_size):
+        self.pop = fresh_population(population_size, 20, 5, num_inputs=4, num_outputs=2)
+        self.inputs = np.random.RandomState(0).uniform(-1, 1, (16, 4))
+
+    def time_generation(self, population_size):
+        for g in self.pop.genomes:
+            g.fitness = fitness(g, self.inputs)
+        self.pop.reproduce()
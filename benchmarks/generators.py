@@ -0,0 +1,93 @@
+'''
+synthetic genomes and populations of controlled size, for the benchmarks.
+everything is seeded, so every run (and every release) measures the same networks
+'''
+
+import functools
+import pickle
+import numpy as np
+from sneat.config import get_config
+from sneat.genome import Genome
+from sneat.neuralnetwork import Node, Connection
+from sneat.population import Population
+
+def make_population(population_size=150, num_nodes=10, num_species=5, num_inputs=8, num_outputs=4, seed=0):
+    '''
+    a speciated population of population_size genomes. each species descends from its
+    own random network of num_nodes nodes, and its members differ by their weights only
+    '''
+
+    np.random.seed(seed)
+    pop = Population(initialize=False, config=get_config().override({
+        'Population': {'population_size': population_size},
+        'NeuralNetwork': {'num_inputs': num_inputs, 'num_outputs': num_outputs},
+        'Evolution': {'target_species': num_species, 'min_species': num_species}
+    }))
+
+    bases = [make_genome(pop, num_nodes) for _ in range(num_species)]
+    genomes = [perturbed(pop, bases[i % num_species]) for i in range(population_size)]
+    pop.speciate(genomes)
+    return pop
+
+def fresh_population(*args, **kwargs):
+    '''
+    an unused copy of make_population(*args, **kwargs), for benchmarks that modify the
+    population. the first one is generated, later ones are restored from a pickle
+    '''
+
+    return pickle.loads(pickled_population(*args, **kwargs))
+
+@functools.lru_cache(maxsize=None)
+def pickled_population(*args, **kwargs):
+    return pickle.dumps(make_population(*args, **kwargs))
+
+def make_genome(pop, num_nodes, connections_per_node=2):
+    '''
+    a random feed-forward network with num_nodes nodes (at least the inputs and outputs),
+    where every hidden and output node gets connections_per_node incoming connections
+    '''
+
+    genome = Genome(pop.callbacks)
+    network = genome.network
+    inputs = [n for n in network.nodes if n.node_type == 'input']
+    outputs = [n for n in network.nodes if n.node_type == 'output']
+    hidden = [Node(network.next_node_id()) for _ in range(max(num_nodes - len(network.nodes), 0))]
+    network.nodes.extend(hidden)
+
+    # connections only ever point forward in this order, so the network is acyclic
+    order = inputs + hidden + outputs
+    existing = {(c.in_node.id, c.out_node.id) for c in network.connections}
+    for position in range(len(inputs), len(order)):
+        out_node = order[position]
+        candidates = order[:min(position, len(inputs) + len(hidden))]
+        for i in np.random.choice(len(candidates), min(connections_per_node, len(candidates)), replace=False):
+            in_node = candidates[i]
+            if (in_node.id, out_node.id) not in existing:
+                existing.add((in_node.id, out_node.id))
+                innovation_number = pop.callbacks['find_or_create_innovation'](in_node, out_node)
+                network.connections.append(Connection(innovation_number, in_node, out_node))
+
+    network.adjacency = None
+    network.invalidate_plan()
+    return genome
+
+def perturbed(pop, genome):
+    '''
+    a copy of the genome with jittered weights and a random fitness
+    '''
+
+    child = genome.clone()
+    child.id = pop.get_next_genome_id()
+    child.fitness = float(np.random.uniform(0, 100))
+    for c, jitter in zip(child.network.connections, np.random.normal(0, 0.1, len(child.network.connections)).tolist()):
+        c.weight += jitter
+    child.network.invalidate_plan()
+    return child
+
+def fitness(genome, inputs):
+    '''
+    a cheap, deterministic fitness function: how close the outputs stay to zero over a fixed batch
+    '''
+
+    outputs = genome.activate_batch(inputs)
+    return float(100 / (1 + np.mean(outputs ** 2)))
@@ -1,39 +1,38 @@
-import gymnasium as gym
 import sys
 import os
-import numpy as np
 import pickle
 
 sys.path.append(os.path.join(os.path.dirname(__file__), '../..'))
 
 from sneat import evolve
+from sneat.episodes import make_envs, evaluate_episodes
 
-def fitness(genome, render=False):
-    env = gym.make('HalfCheetah-v5', render_mode='human' if render else 'rgb_array')
-    obs, info = env.reset()
+ENV_ID = 'HalfCheetah-v5'
+EPISODES = 4 # fitness is the mean return over this many episodes, played side by side
 
-    fitness = 0
-    for _ in range(1000):
-        obs = list(obs)
-        action = genome.activate(obs)
-        obs, reward, terminated, truncated, info = env.step(action)
+# created once in every worker process by init_worker, then reused by every evaluation
+envs = None
 
-        fitness += reward
+def init_worker():
+    global envs
+    envs = make_envs(ENV_ID, EPISODES)
 
-        if terminated or truncated:
-            obs, info = env.reset()
+def fitness(genome):
+    return evaluate_episodes(genome, envs)
 
-    env.close()
-    return fitness
+def show(genome):
+    render_envs = make_envs(ENV_ID, 1, render_mode='human')
+    evaluate_episodes(genome, render_envs)
+    render_envs.close()
 
 def main():
     if len(sys.argv) > 1:
         with open(sys.argv[1], 'rb') as f:
             winner = pickle.load(f)
-            fitness(winner, render=True)
+            show(winner)
     else:
-        winner = evolve(fitness)
-        fitness(winner, render=True)
+        winner = evolve(fitness, initializer=init_worker)
+        show(winner)
 
 if __name__ == '__main__':
-    main()
\ No newline at end of file
+    main()
@@ -6,16 +6,21 @@ with open('README.md', 'r', encoding='utf-8') as f:
 setup(
     name='sneat',
     version='1.0.3',
-    packages=find_packages(),
+    packages=find_packages(exclude=['benchmarks']),
     package_data={'sneat': ['default_config.ini']},
+    entry_points={
+        'console_scripts': ['sneat-worker=sneat.distributed:main']
+    },
     install_requires=[
-        'matplotlib==3.9.0',
-        'networkx==3.3',
         'numpy==1.26.4',
         'tabulate==0.9.0',
         'tqdm==4.66.4'
     ],
     extras_require={
+        'visualize': [
+            'matplotlib==3.9.0',
+            'networkx==3.3'
+        ],
         'examples': [
             'gymnasium==1.0.0a2',
             'gymnasium[box2d]',
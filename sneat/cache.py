@@ -0,0 +1,142 @@
+import collections
+from .evaluator import RacedFitness
+
+class FitnessCache:
+    '''
+    a bounded, least-recently-used map from structural genome hashes to fitness.
+
+    in 'exact' mode a cached fitness is reused as-is, which is only valid for
+    deterministic fitness functions. in 'average' mode every genome is still
+    evaluated, but its fitness becomes the running mean of all samples seen for
+    the same genes, which smooths out noisy fitness functions
+    '''
+
+    def __init__(self, size=10000, mode='exact'):
+        if mode not in ('exact', 'average'):
+            raise ValueError(f'Unknown fitness cache mode: {mode}')
+        self.size = size
+        self.mode = mode
+        self.entries = collections.OrderedDict() # hash -> (mean fitness, number of samples)
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get(self, key):
+        '''
+        returns the cached fitness for the key, or None. always None in 'average' mode,
+        since every genome is sampled again there
+        '''
+
+        if self.mode == 'exact' and key in self.entries:
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return self.entries[key][0]
+        return None
+
+    def put(self, key, fitness):
+        '''
+        stores a freshly evaluated fitness and returns the fitness to assign,
+        which is the mean over all samples in 'average' mode
+        '''
+
+        if key in self.entries:
+            self.hits += 1
+            if self.mode == 'average':
+                mean, count = self.entries[key]
+                count += 1
+                fitness = mean + (fitness - mean) / count
+                self.entries[key] = (fitness, count)
+            self.entries.move_to_end(key)
+        else:
+            self.misses += 1
+            self.entries[key] = (fitness, 1)
+            if len(self.entries) > self.size:
+                self.entries.popitem(last=False)
+        return fitness
+
+class CachedEvaluator:
+    '''
+    wraps an evaluator (local or distributed) so that genomes whose genes are
+    already in the cache are not sent to the workers again
+    '''
+
+    def __init__(self, evaluator, cache):
+        self.evaluator = evaluator
+        self.cache = cache
+        self.num_workers = evaluator.num_workers
+        self.ready = collections.deque() # (genome, fitness) pairs answered from the cache
+        self.keys = {} # id of an in-flight genome -> its hash
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self.terminate()
+
+    def evaluate(self, genomes):
+        '''
+        returns the fitness of every genome, in order. in 'exact' mode, genomes that
+        share their genes are only evaluated once. in 'average' mode every genome is
+        evaluated, each one adding a sample to the average
+        '''
+
+        keys = [g.structural_hash() for g in genomes]
+        fitness_scores = [self.cache.get(k) for k in keys]
+        missing = [i for i, fitness in enumerate(fitness_scores) if fitness is None]
+
+        if self.cache.mode == 'average':
+            for i, fitness in zip(missing, self.evaluator.evaluate([genomes[i] for i in missing])):
+                fitness_scores[i] = self.record(keys[i], fitness)
+            return fitness_scores
+
+        # evaluate one genome per distinct uncached hash
+        first = {}
+        for i in missing:
+            first.setdefault(keys[i], i)
+        evaluated = self.evaluator.evaluate([genomes[i] for i in first.values()])
+        results = {k: self.record(k, fitness) for k, fitness in zip(first, evaluated)}
+        self.cache.hits += len(missing) - len(first) # copies within the batch got a free ride
+
+        for i in missing:
+            fitness_scores[i] = results[keys[i]]
+        return fitness_scores
+
+    def record(self, key, fitness):
+        # a fitness cut short by racing is no sample of the final fitness, so it's kept out of the cache
+        if isinstance(fitness, RacedFitness):
+            return fitness
+        return self.cache.put(key, fitness)
+
+    def submit(self, genome):
+        '''
+        queues a single genome for evaluation, unless its fitness is cached
+        '''
+
+        key = genome.structural_hash()
+        fitness = self.cache.get(key)
+        if fitness is not None:
+            self.ready.append((genome, fitness))
+        else:
+            self.keys[id(genome)] = key
+            self.evaluator.submit(genome)
+
+    def next_result(self):
+        '''
+        returns a genome answered from the cache if there is one, otherwise waits for the workers
+        '''
+
+        if self.ready:
+            return self.ready.popleft()
+        genome, fitness = self.evaluator.next_result()
+        return genome, self.record(self.keys.pop(id(genome)), fitness)
+
+    def close(self):
+        self.evaluator.close()
+
+    def terminate(self):
+        self.evaluator.terminate()
@@ -0,0 +1,226 @@
+import itertools
+import json
+import os
+import tempfile
+import numpy as np
+from .config import activation_functions
+from .genome import Genome
+from .neuralnetwork import NeuralNetwork, Node, Connection
+from .normalizer import Normalizer
+from .population import Population
+from .species import Species
+
+FORMAT_VERSION = 1
+NODE_TYPES = ['input', 'hidden', 'output']
+
+def save_checkpoint(pop, path):
+    '''
+    writes the population to a compressed .npz file: flat gene arrays for all genomes,
+    plus a small json header. the file is written next to its destination and then
+    renamed over it, so a crash mid-write never corrupts the previous checkpoint
+    '''
+
+    # every genome that is referenced from somewhere gets one slot in the gene arrays
+    genomes, index = [], {}
+    def add(g):
+        if id(g) not in index:
+            index[id(g)] = len(genomes)
+            genomes.append(g)
+        return index[id(g)]
+
+    members = [[add(g) for g in s.members] for s in pop.species]
+    representatives = [add(s.representative) for s in pop.species]
+    best = add(pop.best_genome_seen) if pop.best_genome_seen else -1
+
+    activations = sorted(activation_functions.keys() | {n.activation for g in genomes for n in g.network.nodes})
+    activation_codes = {name: i for i, name in enumerate(activations)}
+    networks = [g.network for g in genomes]
+    own_normalizer = [hasattr(net, 'normalizer') and net.normalizer is not pop.normalizer for net in networks]
+    normalizers = [net.normalizer for net, own in zip(networks, own_normalizer) if own]
+    shared = [pop.normalizer, pop.normalizer.pending] if pop.normalizer is not None else []
+    rng_state = np.random.get_state()
+
+    header = {
+        'version': FORMAT_VERSION,
+        'generation': pop.generation,
+        'genome_counter': pop.genome_counter,
+        'species_counter': pop.species_counter,
+        'innovation_counter': pop.innovation_counter,
+        'compatibility_threshold': pop.compatibility_threshold,
+        'best_genome_seen': best,
+        'activations': activations,
+        'rng': [rng_state[0], int(rng_state[2]), int(rng_state[3]), float(rng_state[4])]
+    }
+
+    arrays = {
+        'header': np.array(json.dumps(header)),
+        'rng_keys': rng_state[1],
+
+        # genomes
+        'genome_id': np.array([g.id for g in genomes], dtype=np.int64),
+        'genome_fitness': np.array([g.fitness for g in genomes], dtype=float),
+        'genome_node_counter': np.array([net.node_counter for net in networks], dtype=np.int64),
+        'genome_num_nodes': np.array([len(net.nodes) for net in networks], dtype=np.int64),
+        'genome_num_connections': np.array([len(net.connections) for net in networks], dtype=np.int64),
+        'genome_has_normalizer': np.array(own_normalizer, dtype=bool),
+
+        # node genes
+        'node_id': np.array([n.id for net in networks for n in net.nodes], dtype=np.int64),
+        'node_type': np.array([NODE_TYPES.index(n.node_type) for net in networks for n in net.nodes], dtype=np.int8),
+        'node_bias': np.array([n.bias for net in networks for n in net.nodes], dtype=float),
+        'node_activation': np.array([activation_codes[n.activation] for net in networks for n in net.nodes], dtype=np.int16),
+
+        # connection genes
+        'connection_innovation': np.array([c.innovation_number for net in networks for c in net.connections], dtype=np.int64),
+        'connection_in': np.array([c.in_node.id for net in networks for c in net.connections], dtype=np.int64),
+        'connection_out': np.array([c.out_node.id for net in networks for c in net.connections], dtype=np.int64),
+        'connection_weight': np.array([c.weight for net in networks for c in net.connections], dtype=float),
+        'connection_enabled': np.array([c.enabled for net in networks for c in net.connections], dtype=bool),
+
+        # normalizer statistics, one row per genome that has a normalizer
+        'normalizer_n': np.array([n.n for n in normalizers], dtype=float),
+        'normalizer_mean': np.array([n.mean for n in normalizers], dtype=float),
+        'normalizer_mean_diff': np.array([n.mean_diff for n in normalizers], dtype=float),
+        'normalizer_var': np.array([n.var for n in normalizers], dtype=float),
+
+        # the population's shared normalizer, if any: the frozen statistics, then those observed since
+        'shared_normalizer_n': np.array([n.n for n in shared], dtype=float),
+        'shared_normalizer_mean': np.array([n.mean for n in shared], dtype=float),
+        'shared_normalizer_mean_diff': np.array([n.mean_diff for n in shared], dtype=float),
+
+        # species
+        'species_id': np.array([s.id for s in pop.species], dtype=np.int64),
+        'species_stagnation': np.array([s.stagnation for s in pop.species], dtype=np.int64),
+        'species_best_fitness': np.array([s.best_fitness for s in pop.species], dtype=float),
+        'species_representative': np.array(representatives, dtype=np.int64),
+        'species_num_members': np.array([len(m) for m in members], dtype=np.int64),
+        'species_members': np.array([i for m in members for i in m], dtype=np.int64),
+
+        # innovation registry
+        'innovation_in': np.array([k[0] for k in pop.innovations], dtype=np.int64),
+        'innovation_out': np.array([k[1] for k in pop.innovations], dtype=np.int64),
+        'innovation_number': np.array(list(pop.innovations.values()), dtype=np.int64),
+    }
+
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.checkpoint-', suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            np.savez_compressed(f, **arrays)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+
+def load_checkpoint(path, config=None):
+    '''
+    restores a population written by save_checkpoint, including the random number
+    generator state. returns None if there's no checkpoint at the given path. the
+    population gets the given config, or the one from the files
+    '''
+
+    try:
+        with np.load(path, allow_pickle=False) as archive:
+            data = {name: archive[name] for name in archive.files} # npz members are decompressed on every access
+    except FileNotFoundError:
+        return None
+
+    header = json.loads(str(data['header']))
+    if header['version'] != FORMAT_VERSION:
+        raise ValueError(f'Unsupported checkpoint version {header['version']}')
+
+    activations = header['activations']
+
+    # walk the gene arrays as python lists, element access on numpy arrays is slow
+    node_genes = zip(*(data[k].tolist() for k in ('node_id', 'node_type', 'node_bias', 'node_activation')))
+    connection_genes = zip(*(data[k].tolist() for k in ('connection_innovation', 'connection_in', 'connection_out', 'connection_weight', 'connection_enabled')))
+    normalizer_rows = iter(range(len(data['normalizer_n'])))
+
+    # every network gets the population's normalizer if it's shared
+    pop = Population(initialize=False, config=config)
+    if pop.normalizer is not None and 'shared_normalizer_n' in data and len(data['shared_normalizer_n']):
+        for normalizer, row in ((pop.normalizer, 0), (pop.normalizer.pending, 1)):
+            normalizer.n = data['shared_normalizer_n'][row].copy()
+            normalizer.mean = data['shared_normalizer_mean'][row].copy()
+            normalizer.mean_diff = data['shared_normalizer_mean_diff'][row].copy()
+            normalizer.update_var()
+        pop.normalizer.freeze()
+
+    genomes = []
+    for genome_id, fitness, node_counter, num_nodes, num_connections, has_normalizer in zip(*(data[k].tolist() for k in (
+        'genome_id', 'genome_fitness', 'genome_node_counter', 'genome_num_nodes', 'genome_num_connections', 'genome_has_normalizer'
+    ))):
+        network = NeuralNetwork.__new__(NeuralNetwork)
+        network.node_counter = node_counter
+        network.plan = None
+        network.recurrent_plan = None
+        network.compiled = None
+        network.state = None
+        network.backend = pop.config.neural_network.backend
+        network.adjacency = None
+
+        network.nodes = []
+        for node_id, node_type, bias, activation in itertools.islice(node_genes, num_nodes):
+            node = Node.__new__(Node)
+            node.id = node_id
+            node.node_type = NODE_TYPES[node_type]
+            node.bias = bias
+            node.activation = activations[activation]
+            network.nodes.append(node)
+
+        nodes = {n.id: n for n in network.nodes}
+        network.connections = []
+        for innovation_number, in_node, out_node, weight, enabled in itertools.islice(connection_genes, num_connections):
+            connection = Connection.__new__(Connection)
+            connection.innovation_number = innovation_number
+            connection.in_node = nodes[in_node]
+            connection.out_node = nodes[out_node]
+            connection.weight = weight
+            connection.enabled = enabled
+            network.connections.append(connection)
+
+        if pop.normalizer is not None:
+            network.normalizer = pop.normalizer
+        elif has_normalizer:
+            row = next(normalizer_rows)
+            network.normalizer = Normalizer(data['normalizer_mean'].shape[1])
+            network.normalizer.n = data['normalizer_n'][row].copy()
+            network.normalizer.mean = data['normalizer_mean'][row].copy()
+            network.normalizer.mean_diff = data['normalizer_mean_diff'][row].copy()
+            network.normalizer.var = data['normalizer_var'][row].copy()
+
+        genome = Genome.__new__(Genome)
+        genome.id = genome_id
+        genome.fitness = fitness
+        genome.normalized_fitness = 0
+        genome.adjusted_fitness = 0
+        genome.network = network
+        genomes.append(genome)
+
+    pop.generation = header['generation']
+    pop.genome_counter = header['genome_counter']
+    pop.species_counter = header['species_counter']
+    pop.innovation_counter = header['innovation_counter']
+    pop.compatibility_threshold = header['compatibility_threshold']
+    pop.best_genome_seen = genomes[header['best_genome_seen']] if header['best_genome_seen'] >= 0 else None
+    pop.innovations = {(a, b): n for a, b, n in zip(data['innovation_in'].tolist(), data['innovation_out'].tolist(), data['innovation_number'].tolist())}
+
+    members = iter(data['species_members'].tolist())
+    for species_id, stagnation, best_fitness, representative, num_members in zip(*(data[k].tolist() for k in (
+        'species_id', 'species_stagnation', 'species_best_fitness', 'species_representative', 'species_num_members'
+    ))):
+        s = Species.__new__(Species)
+        s.id = species_id
+        s.stagnation = stagnation
+        s.best_fitness = best_fitness
+        s.representative = genomes[representative]
+        s.members = [genomes[j] for j in itertools.islice(members, num_members)]
+        pop.species.append(s)
+
+    name, pos, has_gauss, cached_gaussian = header['rng']
+    np.random.set_state((name, data['rng_keys'], pos, has_gauss, cached_gaussian))
+
+    print(f'[+] Loaded checkpoint (gen. {pop.generation})')
+    return pop
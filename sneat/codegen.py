@@ -0,0 +1,126 @@
+'''
+compiles feed-forward networks into straight-line python: one local variable per node,
+weights inlined as constants and activations inlined as scalar math. for small networks
+this beats pushing single input vectors through the array-based plan, which pays the
+overhead of numpy for every layer
+'''
+
+import collections
+import hashlib
+import math
+from .config import activation_functions
+
+# scalar versions of sneat.config.activation_functions, other functions are called through that dict
+ACTIVATION_SOURCE = {
+    'sigmoid': '1.0 / (1.0 + exp(-min(max({x}, -20.0), 20.0)))',
+    'tanh': 'tanh({x})',
+    'relu': 'max(0.0, {x})',
+    'leaky_relu': 'max(0.01 * ({x}), {x})',
+    'linear': '{x}',
+    'gaussian': 'exp(-min(max({x}, -20.0), 20.0) ** 2)',
+    'sin': 'sin({x})',
+    'cos': 'cos({x})',
+}
+
+NAMESPACE = {'exp': math.exp, 'tanh': math.tanh, 'sin': math.sin, 'cos': math.cos, 'functions': activation_functions}
+
+# compiled networks by gene hash, shared by every network with the same genes
+cache = collections.OrderedDict()
+CACHE_SIZE = 1000
+
+class CompiledNetwork:
+    '''
+    a network compiled into a python function that takes a sequence of inputs and returns
+    a list of outputs. it's pickled as its source, and rebuilt from the cache or by
+    compiling that source again
+    '''
+
+    def __init__(self, key, source):
+        self.key = key
+        self.source = source
+        self.function = build(source)
+
+    def __getstate__(self):
+        return {'key': self.key, 'source': self.source}
+
+    def __setstate__(self, state):
+        self.key = state['key']
+        self.source = state['source']
+        cached = cache.get(self.key)
+        self.function = cached.function if cached is not None else build(self.source)
+        remember(self)
+
+    def __call__(self, inputs):
+        return self.function(inputs)
+
+def build(source):
+    namespace = dict(NAMESPACE)
+    exec(compile(source, '<sneat.codegen>', 'exec'), namespace)
+    return namespace['activate']
+
+def remember(compiled):
+    cache[compiled.key] = compiled
+    cache.move_to_end(compiled.key)
+    if len(cache) > CACHE_SIZE:
+        cache.popitem(last=False)
+
+def generate_source(network):
+    '''
+    the source of the activate(inputs) function for the network's current genes
+    '''
+
+    plan = network.get_plan()
+    nodes = network.nodes
+    index = {node.id: i for i, node in enumerate(nodes)}
+    incoming = {i: [] for i in range(len(nodes))}
+    for c in network.connections:
+        if c.enabled:
+            incoming[index[c.out_node.id]].append((index[c.in_node.id], c.weight))
+
+    # only the nodes the outputs depend on are computed
+    needed = set(plan.output_idx.tolist())
+    stack = list(needed)
+    while stack:
+        for src, _ in incoming[stack.pop()]:
+            if src not in needed:
+                needed.add(src)
+                stack.append(src)
+
+    lines = ['def activate(inputs):']
+    lines.append(f'    {', '.join(f'v{i}' for i in plan.input_idx.tolist())}{',' if len(plan.input_idx) == 1 else ''} = inputs')
+    for layer in plan.layers:
+        for i in layer.nodes.tolist():
+            if i not in needed:
+                continue
+
+            # nodes without incoming connections are activated from zero, without their bias
+            terms = [repr(nodes[i].bias)] + [f'{weight!r} * v{src}' for src, weight in incoming[i]] if incoming[i] else ['0.0']
+            x = ' + '.join(terms)
+            name = nodes[i].activation
+            if name in ACTIVATION_SOURCE and ACTIVATION_SOURCE[name].count('{x}') > 1:
+                lines.append(f'    v{i} = {x}')
+                lines.append(f'    v{i} = {ACTIVATION_SOURCE[name].format(x=f'v{i}')}')
+            elif name in ACTIVATION_SOURCE:
+                lines.append(f'    v{i} = {ACTIVATION_SOURCE[name].format(x=x)}')
+            else:
+                lines.append(f'    v{i} = float(functions[{name!r}]({x}))')
+    lines.append(f'    return [{', '.join(f'v{i}' for i in plan.output_idx.tolist())}]')
+    return '\n'.join(lines) + '\n'
+
+def compile_network(network):
+    '''
+    returns the compiled function of the network, reusing the one of any network
+    with the same genes that was compiled before
+    '''
+
+    # the function takes the inputs and returns the outputs in the order of the node list
+    h = hashlib.blake2b(digest_size=16)
+    network.hash_genes(h)
+    h.update(str([n.id for n in network.nodes if n.node_type != 'hidden']).encode())
+    key = h.hexdigest()
+
+    compiled = cache.get(key)
+    if compiled is None:
+        compiled = CompiledNetwork(key, generate_source(network))
+    remember(compiled)
+    return compiled
@@ -1,5 +1,6 @@
 import numpy as np
 import configparser as cp
+import dataclasses
 import os
 
 # activation functions
@@ -14,18 +15,261 @@ activation_functions = {
     'cos': lambda x: np.cos(x),
 }
 
+# hidden nodes pick their activation function from these
+activation_names = tuple(activation_functions)
+
+# the configuration is parsed once into frozen dataclasses, one per section of the ini
+# file, so the hot paths read plain attributes instead of asking a ConfigParser
+
+def check(condition, section, key, message):
+    if not condition:
+        raise ValueError(f'Invalid configuration, [{section}] {key} {message}')
+
+@dataclasses.dataclass(frozen=True)
+class NeuralNetworkConfig:
+    num_inputs: int
+    num_outputs: int
+    input_activation: str
+    output_activation: str
+    use_normalizer: bool
+    shared_normalizer: bool
+    recurrent: bool
+    backend: str
+
+    def __post_init__(self):
+        check(self.num_inputs > 0, 'NeuralNetwork', 'num_inputs', 'must be at least 1')
+        check(self.num_outputs > 0, 'NeuralNetwork', 'num_outputs', 'must be at least 1')
+        check(self.input_activation in activation_functions, 'NeuralNetwork', 'input_activation', f'is not an activation function: {self.input_activation}')
+        check(self.output_activation in activation_functions, 'NeuralNetwork', 'output_activation', f'is not an activation function: {self.output_activation}')
+        check(self.backend in ('plan', 'codegen'), 'NeuralNetwork', 'backend', f'must be plan or codegen, not {self.backend}')
+
+@dataclasses.dataclass(frozen=True)
+class PopulationConfig:
+    population_size: int
+    compatibility_threshold: float
+    min_species_size: int
+    elite_size: int
+    survival_threshold: float
+    retire_innovations: bool
+
+    def __post_init__(self):
+        check(self.population_size > 0, 'Population', 'population_size', 'must be at least 1')
+        check(self.compatibility_threshold > 0, 'Population', 'compatibility_threshold', 'must be positive')
+        check(self.min_species_size >= 0, 'Population', 'min_species_size', 'can\'t be negative')
+        check(self.elite_size >= 0, 'Population', 'elite_size', 'can\'t be negative')
+        check(0 < self.survival_threshold <= 1, 'Population', 'survival_threshold', 'must be in (0, 1]')
+
+@dataclasses.dataclass(frozen=True)
+class MutationRatesConfig:
+    # in the order the mutations are drawn in
+    add_node: float
+    add_connection: float
+    change_weight: float
+    change_activation: float
+    toggle_connection: float
+    change_bias: float
+    remove_node: float
+
+    # the mutation names and their rates normalized to probabilities, precomputed for Genome.mutate_all
+    names: tuple = dataclasses.field(init=False, repr=False, compare=False)
+    probabilities: np.ndarray = dataclasses.field(init=False, repr=False, compare=False)
+
+    def __post_init__(self):
+        names = tuple(f.name for f in dataclasses.fields(self) if f.init)
+        rates = np.array([getattr(self, name) for name in names], dtype=float)
+        for name, rate in zip(names, rates):
+            check(rate >= 0, 'MutationRates', name, 'can\'t be negative')
+        check(rates.sum() > 0, 'MutationRates', ', '.join(names), 'can\'t all be zero')
+
+        probabilities = rates / rates.sum()
+        probabilities.setflags(write=False)
+        object.__setattr__(self, 'names', names)
+        object.__setattr__(self, 'probabilities', probabilities)
+
+@dataclasses.dataclass(frozen=True)
+class EvolutionConfig:
+    max_generations: int
+    max_fitness: float
+    max_stagnation: int
+    min_species: int
+    target_species: int
+    mode: str
+    checkpoint_interval: int
+    checkpoint_path: str
+
+    def __post_init__(self):
+        check(self.max_generations >= 0, 'Evolution', 'max_generations', 'can\'t be negative')
+        check(self.checkpoint_interval >= 0, 'Evolution', 'checkpoint_interval', 'can\'t be negative')
+        check(self.mode in ('generational', 'steady_state'), 'Evolution', 'mode', f'must be generational or steady_state, not {self.mode}')
+
+@dataclasses.dataclass(frozen=True)
+class EvaluationConfig:
+    backend: str
+    num_workers: int
+    chunksize: int
+    address: str
+    authkey: str
+    worker_timeout: float
+    fitness_cache: bool
+    cache_size: int
+    cache_mode: str
+    racing: bool
+    racing_percentile: float
+    racing_min_samples: int
+
+    def __post_init__(self):
+        check(self.backend in ('local', 'distributed'), 'Evaluation', 'backend', f'must be local or distributed, not {self.backend}')
+        check(self.num_workers >= 0, 'Evaluation', 'num_workers', 'can\'t be negative')
+        check(self.chunksize > 0, 'Evaluation', 'chunksize', 'must be at least 1')
+        check(self.cache_size > 0, 'Evaluation', 'cache_size', 'must be at least 1')
+        check(self.cache_mode in ('exact', 'average'), 'Evaluation', 'cache_mode', f'must be exact or average, not {self.cache_mode}')
+        check(0 <= self.racing_percentile <= 100, 'Evaluation', 'racing_percentile', 'must be in [0, 100]')
+
+@dataclasses.dataclass(frozen=True)
+class MetricsConfig:
+    enabled: bool
+    path: str
+    trace_memory: bool
+    profile_generations: tuple # generation numbers, comma separated in the ini file
+    profile_path: str
+
+# ini section -> (attribute of Config, section class)
+SECTIONS = {
+    'NeuralNetwork': ('neural_network', NeuralNetworkConfig),
+    'Population': ('population', PopulationConfig),
+    'MutationRates': ('mutation_rates', MutationRatesConfig),
+    'Evolution': ('evolution', EvolutionConfig),
+    'Evaluation': ('evaluation', EvaluationConfig),
+    'Metrics': ('metrics', MetricsConfig),
+}
+
+@dataclasses.dataclass(frozen=True)
+class Config:
+    neural_network: NeuralNetworkConfig
+    population: PopulationConfig
+    mutation_rates: MutationRatesConfig
+    evolution: EvolutionConfig
+    evaluation: EvaluationConfig
+    metrics: MetricsConfig
+
+    def override(self, settings):
+        '''
+        a copy with the given settings changed, as {section: {key: value}} with the
+        section names of the ini file. values can be strings, as in the ini file, or
+        of the option's type
+        '''
+
+        unknown = set(settings) - SECTIONS.keys()
+        if unknown:
+            raise ValueError(f'Unknown configuration sections: {', '.join(sorted(unknown))}')
+
+        changes = {}
+        for section, values in settings.items():
+            attribute, cls = SECTIONS[section]
+            changes[attribute] = dataclasses.replace(getattr(self, attribute), **convert(cls, section, values))
+        return dataclasses.replace(self, **changes)
+
+def convert(cls, section, values):
+    '''
+    the values of a section converted to the types of its options
+    '''
+
+    types = {f.name: f.type for f in dataclasses.fields(cls) if f.init}
+    unknown = set(values) - types.keys()
+    if unknown:
+        raise ValueError(f'Unknown options in [{section}]: {', '.join(sorted(unknown))}')
+
+    converted = {}
+    for key, value in values.items():
+        kind = types[key]
+        try:
+            if isinstance(value, str):
+                value = value.strip()
+                if kind is bool:
+                    if value.lower() not in cp.ConfigParser.BOOLEAN_STATES:
+                        raise ValueError(value)
+                    value = cp.ConfigParser.BOOLEAN_STATES[value.lower()]
+                elif kind is tuple:
+                    value = tuple(int(g) for g in value.split(',') if g.strip())
+                else:
+                    value = kind(value)
+            elif kind is tuple:
+                value = tuple(int(g) for g in value)
+            elif kind is not bool or not isinstance(value, (bool, np.bool_)):
+                value = kind(value)
+        except (TypeError, ValueError):
+            raise ValueError(f'Invalid configuration, [{section}] {key} must be a {kind.__name__}, not {value!r}') from None
+        converted[key] = value
+    return converted
+
+def load_config(*paths):
+    '''
+    parses and validates the given ini files, later files overriding earlier ones
+    '''
+
+    parser = cp.ConfigParser(inline_comment_prefixes=('#', ';'))
+    for path in paths:
+        parser.read(path)
+
+    unknown = set(parser.sections()) - SECTIONS.keys()
+    if unknown:
+        raise ValueError(f'Unknown configuration sections: {', '.join(sorted(unknown))}')
+
+    sections = {}
+    for section, (attribute, cls) in SECTIONS.items():
+        values = dict(parser[section]) if parser.has_section(section) else {}
+        missing = [f.name for f in dataclasses.fields(cls) if f.init and f.name not in values]
+        if missing:
+            raise ValueError(f'Missing options in [{section}]: {', '.join(missing)}')
+        sections[attribute] = cls(**convert(cls, section, values))
+    return Config(**sections)
+
+# the last configuration get_config() returned, with the files (and their modification times) it came from
+cached = None
+
+# set by configure(), applied on top of the files
+overrides = {}
+
 def get_config():
-    config = cp.ConfigParser()
+    '''
+    the configuration: the defaults, overridden by ./config.ini if it exists, and by
+    whatever was passed to configure(). the files are only parsed again if one of them
+    changed (or another working directory has a config.ini)
+    '''
+
+    global cached
 
     # get the directory where this file is located
     dirpath = os.path.abspath(os.path.dirname(__file__))
-    default_config_path = os.path.join(dirpath, 'default_config.ini')
-    config.read(default_config_path)
+    paths = [os.path.join(dirpath, 'default_config.ini')]
 
     # load users config if it exists
     execution_path = os.path.abspath(os.getcwd())
     user_config_path = os.path.join(execution_path, 'config.ini')
     if os.path.exists(user_config_path):
-        config.read(user_config_path)
+        paths.append(user_config_path)
+
+    key = tuple((path, os.path.getmtime(path)) for path in paths)
+    if cached is None or cached[0] != key:
+        cached = (key, load_config(*paths).override(overrides))
+    return cached[1]
+
+def configure(settings=None):
+    '''
+    overrides settings of the configuration from code, as {section: {key: value}} with
+    the section names of the ini file - for embedding sneat where there's no config.ini
+    to write. settings accumulate over calls, configure() without any resets them
+    '''
+
+    global overrides, cached
+
+    merged = {}
+    if settings is not None:
+        # validate them right away, rather than on the next get_config()
+        get_config().override(settings)
+        merged = {section: dict(values) for section, values in overrides.items()}
+        for section, values in settings.items():
+            merged.setdefault(section, {}).update(values)
 
-    return config
\ No newline at end of file
+    overrides = merged
+    cached = None
@@ -0,0 +1,329 @@
+import argparse
+import collections
+import importlib
+import ipaddress
+import multiprocessing as mp
+import os
+import queue
+import socket
+import sys
+import threading
+import time
+import traceback
+import types
+from multiprocessing.managers import BaseManager
+from .evaluator import Racing, run_fitness_function
+from .normalizer import take_partial, add_partial
+
+# the authkey in the default config. the broker unpickles whatever it's sent, so it
+# must not be reachable beyond this machine with a key anyone can look up
+DEFAULT_AUTHKEY = b'sneat'
+
+class RemoteError(Exception):
+    '''
+    raised by the coordinator when a fitness function failed on a worker, with the
+    worker's traceback as its message
+    '''
+
+class Broker:
+    '''
+    the work queue between a coordinator and its remote workers. it lives in the
+    manager's server process, and both sides talk to it through proxies.
+
+    every task handed out is leased to the worker that took it. workers send a
+    heartbeat while they are busy, and the tasks of a worker that stays silent for
+    longer than the timeout are put back in the queue for someone else
+    '''
+
+    def __init__(self, timeout):
+        self.timeout = timeout
+        self.lock = threading.Lock()
+        self.pending = {} # task id -> genome, for every task without a result yet
+        self.tasks = collections.deque() # task ids waiting to be handed out
+        self.leases = {} # task id -> id of the worker evaluating it
+        self.heartbeats = {} # worker id -> time it was last heard from
+        self.results = queue.Queue()
+        self.threshold = float('-inf') # racing threshold, handed to workers with every heartbeat
+
+    def submit(self, task_id, genome):
+        with self.lock:
+            self.pending[task_id] = genome
+            self.tasks.append(task_id)
+
+    def get_task(self, worker_id):
+        '''
+        hands out the next task as a (task id, genome) pair, or None if there is nothing to do
+        '''
+
+        with self.lock:
+            self.heartbeats[worker_id] = time.monotonic()
+            self.requeue_stale()
+            while self.tasks:
+                task_id = self.tasks.popleft()
+                if task_id in self.pending:
+                    self.leases[task_id] = worker_id
+                    return task_id, self.pending[task_id]
+        return None
+
+    def put_result(self, worker_id, task_id, result):
+        with self.lock:
+            self.heartbeats[worker_id] = time.monotonic()
+            self.leases.pop(task_id, None)
+
+            # a task may be finished twice if its worker was presumed dead, keep the first result
+            if self.pending.pop(task_id, None) is not None:
+                self.results.put((task_id, result))
+
+    def heartbeat(self, worker_id):
+        with self.lock:
+            self.heartbeats[worker_id] = time.monotonic()
+            return self.threshold
+
+    def set_threshold(self, value):
+        self.threshold = value
+
+    def cancel(self, task_ids):
+        with self.lock:
+            for task_id in task_ids:
+                self.pending.pop(task_id, None)
+                self.leases.pop(task_id, None)
+
+    def get_result(self, timeout):
+        '''
+        waits up to timeout seconds for a (task id, (fitness, partial normalizer statistics, error))
+        tuple, returning None if none arrived. error is the worker's traceback if the fitness
+        function raised, and None otherwise
+        '''
+
+        with self.lock:
+            self.requeue_stale()
+        try:
+            return self.results.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def requeue_stale(self):
+        # must be called with the lock held
+        now = time.monotonic()
+        stale = {w for w, t in self.heartbeats.items() if now - t > self.timeout}
+        for task_id, worker_id in list(self.leases.items()):
+            if worker_id in stale:
+                del self.leases[task_id]
+                self.tasks.appendleft(task_id)
+        for worker_id in stale:
+            del self.heartbeats[worker_id]
+            print(f'[!] Worker {worker_id} dropped out, its tasks were re-queued', flush=True)
+
+class BrokerManager(BaseManager):
+    pass
+
+# the broker singleton, created in the manager's server process by init_broker
+broker = None
+
+def init_broker(timeout):
+    global broker
+    broker = Broker(timeout)
+
+def get_broker():
+    return broker
+
+BrokerManager.register('broker', callable=get_broker)
+
+def parse_address(address):
+    host, port = address.rsplit(':', 1)
+    return host, int(port)
+
+def check_authkey(address, authkey):
+    '''
+    refuses to serve (or connect to) anything but this machine with the default authkey
+    '''
+
+    host, _ = parse_address(address)
+    try:
+        loopback = ipaddress.ip_address(socket.gethostbyname(host)).is_loopback
+    except (OSError, ValueError):
+        loopback = False
+    if not loopback and authkey == DEFAULT_AUTHKEY:
+        raise ValueError(f'Refusing to use {address} with the default authkey, set a secret one (authkey in [Evaluation]) for anything but 127.0.0.1')
+
+def unpack(result):
+    # the fitness and partial normalizer statistics of a result, or the worker's error
+    fitness, partial, error = result
+    if error is not None:
+        raise RemoteError(f'The fitness function raised on a worker:\n{error}')
+    return fitness, partial
+
+class DistributedEvaluator:
+    '''
+    evaluates genomes on remote worker processes (started with `sneat-worker`),
+    which connect to a broker served by this coordinator over TCP.
+    mirrors the interface of Evaluator, so evolve can use either
+    '''
+
+    def __init__(self, address='127.0.0.1:5555', authkey=DEFAULT_AUTHKEY, timeout=30.0, num_workers=0, racing=None):
+        check_authkey(address, authkey)
+        self.num_workers = num_workers or max(mp.cpu_count() - 1, 1) # genomes kept in flight in steady-state mode
+        self.manager = BrokerManager(address=parse_address(address), authkey=authkey)
+        self.manager.start(init_broker, (timeout,))
+        self.broker = self.manager.broker()
+        self.submitted = {} # task id -> genome
+        self.task_counter = 0
+        self.racing = Racing(self.broker.set_threshold, **racing) if racing is not None else None
+        print(f'[i] Waiting for workers on {address}')
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def evaluate(self, genomes):
+        '''
+        returns the fitness of every genome, in order
+        '''
+
+        from tqdm import tqdm
+
+        if self.racing is not None:
+            self.racing.reset()
+
+        task_ids = [self.submit(g) for g in genomes]
+        fitness_scores = {}
+        with tqdm(total=len(genomes), desc='[-] Evaluating', leave=False) as progress:
+            while len(fitness_scores) < len(genomes):
+                result = self.broker.get_result(1.0)
+                if result is not None and result[0] in self.submitted: # not left over from a cancelled batch
+                    task_id, result = result
+                    try:
+                        fitness, partial = unpack(result)
+                    except RemoteError:
+                        # the rest of the generation is abandoned, as with a local pool
+                        self.cancel(task_ids)
+                        raise
+                    add_partial(self.submitted.pop(task_id), partial)
+                    fitness_scores[task_id] = fitness
+                    if self.racing is not None:
+                        self.racing.record(fitness)
+                    progress.update()
+        return [fitness_scores[t] for t in task_ids]
+
+    def submit(self, genome):
+        '''
+        queues a single genome for evaluation - collect it with next_result
+        '''
+
+        self.task_counter += 1
+        self.submitted[self.task_counter] = genome
+        self.broker.submit(self.task_counter, genome)
+        return self.task_counter
+
+    def cancel(self, task_ids):
+        '''
+        withdraws submitted genomes that haven't been evaluated yet
+        '''
+
+        task_ids = [t for t in task_ids if t in self.submitted]
+        for task_id in task_ids:
+            del self.submitted[task_id]
+        self.broker.cancel(task_ids)
+
+    def next_result(self):
+        '''
+        waits for any submitted genome to finish, returning it along with its fitness
+        '''
+
+        while True:
+            result = self.broker.get_result(1.0)
+            if result is not None and result[0] in self.submitted:
+                task_id, result = result
+                genome = self.submitted.pop(task_id)
+                fitness, partial = unpack(result)
+                if self.racing is not None:
+                    self.racing.record(fitness)
+                add_partial(genome, partial)
+                return genome, fitness
+
+    def close(self):
+        '''
+        shuts the broker down. connected workers exit once they notice
+        '''
+
+        if self.manager is not None:
+            self.broker = None
+            self.manager.shutdown()
+            self.manager = None
+
+    def terminate(self):
+        self.close()
+
+def run_worker(fitness_function, address, authkey=DEFAULT_AUTHKEY, initializer=None, poll_interval=0.5):
+    '''
+    connects to a coordinator and evaluates genomes until it goes away. if the fitness
+    function raises, the traceback is sent back as the result, as the same genome would
+    only fail again on another worker
+    '''
+
+    check_authkey(address, authkey)
+    if initializer is not None:
+        initializer()
+
+    manager = BrokerManager(address=parse_address(address), authkey=authkey)
+    manager.connect()
+    broker = manager.broker()
+    worker_id = f'{socket.gethostname()}:{os.getpid()}'
+    print(f'[+] Worker {worker_id} connected to {address}')
+
+    # keep the lease on the current task alive while a long evaluation runs,
+    # picking up the latest racing threshold on the way
+    threshold = types.SimpleNamespace(value=float('-inf'))
+    stop = threading.Event()
+    def send_heartbeats():
+        while not stop.wait(poll_interval):
+            try:
+                threshold.value = broker.heartbeat(worker_id)
+            except (EOFError, OSError):
+                return
+    threading.Thread(target=send_heartbeats, daemon=True).start()
+
+    try:
+        while True:
+            task = broker.get_task(worker_id)
+            if task is None:
+                time.sleep(poll_interval)
+                continue
+            task_id, genome = task
+            threshold.value = broker.heartbeat(worker_id)
+            try:
+                result = (run_fitness_function(fitness_function, genome, threshold), take_partial(genome), None)
+            except Exception:
+                result = (None, None, traceback.format_exc())
+            broker.put_result(worker_id, task_id, result)
+    except (EOFError, OSError):
+        print('[i] Coordinator went away, exiting')
+    finally:
+        stop.set()
+
+def load_function(spec):
+    module, name = spec.split(':')
+    return getattr(importlib.import_module(module), name)
+
+def main():
+    parser = argparse.ArgumentParser(prog='sneat-worker', description='Evaluates genomes for a distributed sNEAT run.')
+    parser.add_argument('fitness', help='fitness function to evaluate genomes with, as module:function')
+    parser.add_argument('--address', default='127.0.0.1:5555', help='host:port of the coordinator')
+    parser.add_argument('--authkey', default=DEFAULT_AUTHKEY.decode(), help='shared secret, as set in the coordinator\'s config (the default only works on 127.0.0.1)')
+    parser.add_argument('--initializer', help='function to call once before evaluating, as module:function')
+    args = parser.parse_args()
+
+    # allow fitness functions that live next to the script being run
+    sys.path.insert(0, os.getcwd())
+
+    run_worker(
+        load_function(args.fitness),
+        args.address,
+        authkey=args.authkey.encode(),
+        initializer=load_function(args.initializer) if args.initializer else None
+    )
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,105 @@
+import numpy as np
+
+def import_gymnasium():
+    try:
+        import gymnasium
+    except ImportError:
+        raise ImportError('Episode evaluation needs gymnasium, install it with `pip install sneat[examples]`') from None
+    return gymnasium
+
+def make_envs(env_id, episodes, asynchronous=False, **kwargs):
+    '''
+    creates a vector environment that runs the given number of episodes side by side.
+    asynchronous environments step each copy in its own process, which pays off
+    when the simulation itself is expensive. extra keyword arguments go to gymnasium.make
+    '''
+
+    gym = import_gymnasium()
+    env_fns = [lambda: gym.make(env_id, **kwargs) for _ in range(episodes)]
+    if asynchronous:
+        return gym.vector.AsyncVectorEnv(env_fns)
+    return gym.vector.SyncVectorEnv(env_fns)
+
+def clear_autoreset(envs):
+    '''
+    SyncVectorEnv in gymnasium 1.0.0a2 (the version sneat[examples] pins) keeps its
+    autoreset flags across reset(). the copies whose episode ended on the last step of
+    the previous evaluation would then be reset again on the first step of the next one,
+    throwing away the observation reset() returned and the first action. there's no
+    public way to clear the flags in that version, so they're cleared here - and if a
+    gymnasium release no longer has them, this fails rather than silently skewing returns.
+    AsyncVectorEnv clears its flags on reset() in its workers, as later releases of
+    SyncVectorEnv do
+    '''
+
+    gym = import_gymnasium()
+    env = envs.unwrapped
+    if not isinstance(env, gym.vector.SyncVectorEnv):
+        return
+    if not hasattr(env, '_autoreset_envs'):
+        raise RuntimeError(f'SyncVectorEnv of gymnasium {gym.__version__} has no autoreset flags to clear, sneat.episodes.clear_autoreset needs updating')
+    env._autoreset_envs[:] = False
+
+def run_episodes(genome, envs, max_steps=1000, seed=None):
+    '''
+    plays one episode in every copy of the vector environment, feeding the observations
+    of all running episodes through the genome as a single batch per step.
+    yields the step number and the returns so far after every step, and stops
+    once every episode has ended or max_steps is reached
+    '''
+
+    gym = import_gymnasium()
+    discrete = isinstance(envs.single_action_space, gym.spaces.Discrete)
+
+    obs, info = envs.reset(seed=seed)
+    clear_autoreset(envs)
+
+    returns = np.zeros(envs.num_envs)
+    running = np.ones(envs.num_envs, dtype=bool)
+    actions = np.zeros((envs.num_envs,) + envs.single_action_space.shape, dtype=envs.single_action_space.dtype)
+
+    # recurrent networks keep one state per episode, so all of them are stepped together
+    recurrent = genome.network.is_recurrent()
+    if recurrent:
+        genome.reset_state(envs.num_envs)
+
+    for step in range(max_steps):
+
+        # finished episodes get a dummy action, and stay out of the network (and normalizer) unless it's recurrent
+        if recurrent:
+            outputs = genome.step(obs)[running]
+        else:
+            outputs = genome.activate_batch(obs[running])
+        actions[running] = np.argmax(outputs, axis=1) if discrete else outputs
+
+        obs, rewards, terminated, truncated, info = envs.step(actions)
+        returns[running] += rewards[running]
+        running &= ~(terminated | truncated)
+
+        yield step, returns
+        if not running.any():
+            return
+
+def evaluate_episodes(genome, envs, max_steps=1000, seed=None):
+    '''
+    returns the mean return of the genome over one episode per copy of the vector environment
+    '''
+
+    returns = None
+    for _, returns in run_episodes(genome, envs, max_steps, seed):
+        pass
+    return float(np.mean(returns))
+
+def race_episodes(genome, envs, max_reward_per_step, max_steps=1000, seed=None, report_every=50, bonus=0):
+    '''
+    like evaluate_episodes, but as a generator fitness function for racing: every
+    report_every steps it yields the mean return so far, along with an upper bound
+    assuming every remaining step earns max_reward_per_step (plus a one-off bonus)
+    '''
+
+    returns = None
+    for step, returns in run_episodes(genome, envs, max_steps, seed):
+        if step % report_every == 0:
+            mean = float(np.mean(returns))
+            yield mean, mean + bonus + (max_steps - step - 1) * max_reward_per_step
+    return float(np.mean(returns))
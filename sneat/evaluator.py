@@ -0,0 +1,188 @@
+import collections
+import inspect
+import multiprocessing as mp
+import queue
+import signal
+import numpy as np
+from .normalizer import take_partial, add_partial
+
+# set once in every worker process by init_worker
+fitness_function = None
+race_threshold = None
+
+def init_worker(ff, initializer, initargs, threshold=None):
+    global fitness_function, race_threshold
+
+    # ctrl+c is handled by the parent, which tears the pool down
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+    fitness_function = ff
+    race_threshold = threshold
+    if initializer is not None:
+        initializer(*initargs)
+
+def evaluate_genome(genome):
+    '''
+    returns the fitness, along with the shared normalizer statistics observed on the way (if any)
+    '''
+
+    fitness = run_fitness_function(fitness_function, genome, race_threshold)
+    return fitness, take_partial(genome)
+
+def evaluate_indexed(task):
+    index, genome = task
+    return index, evaluate_genome(genome)
+
+class RacedFitness(float):
+    '''
+    the fitness of a genome that was stopped early by racing - the fitness so far
+    rather than a final one, so it's never cached
+    '''
+
+def run_fitness_function(ff, genome, threshold=None):
+    '''
+    calls the fitness function. if it's a generator function, it's expected to yield
+    (fitness so far, upper bound on the final fitness) every now and then, and it's
+    stopped early - keeping the fitness so far - once the upper bound falls below
+    threshold.value. the final fitness is the generator's return value, or the last
+    fitness it yielded
+    '''
+
+    result = ff(genome)
+    if not inspect.isgenerator(result):
+        return result
+
+    fitness = None
+    try:
+        while True:
+            fitness, upper_bound = next(result)
+            if threshold is not None and upper_bound < threshold.value:
+                result.close()
+                return RacedFitness(fitness)
+    except StopIteration as stop:
+        return fitness if stop.value is None else stop.value
+
+class Racing:
+    '''
+    tracks the fitness of recently evaluated genomes, and publishes the percentile
+    that a generator-style fitness function's upper bound must reach to keep going
+    '''
+
+    def __init__(self, publish, percentile=50, min_samples=10, window=None):
+        self.publish = publish
+        self.percentile = percentile
+        self.min_samples = min_samples
+        self.completed = collections.deque(maxlen=window)
+        self.reset()
+
+    def reset(self):
+        self.completed.clear()
+        self.publish(float('-inf'))
+
+    def record(self, fitness):
+        # a genome stopped early only has its fitness so far, which would drag the threshold down
+        if isinstance(fitness, RacedFitness):
+            return
+        self.completed.append(fitness)
+        if len(self.completed) >= self.min_samples:
+            self.publish(float(np.percentile(self.completed, self.percentile)))
+
+class Evaluator:
+    '''
+    a pool of worker processes that lives for a whole run. the fitness function is
+    shipped to each worker once, and the optional initializer runs once per worker
+    (to build an environment that every evaluation can reuse, for example)
+    '''
+
+    def __init__(self, fitness_function, num_workers=0, chunksize=1, initializer=None, initargs=(), racing=None):
+        self.num_workers = num_workers or max(mp.cpu_count() - 1, 1)
+        self.chunksize = chunksize
+        self.results = queue.Queue()
+
+        # racing is a dict of Racing arguments, the threshold is shared with the workers
+        self.threshold = mp.Value('d', float('-inf'), lock=False) if racing is not None else None
+        self.racing = Racing(lambda value: setattr(self.threshold, 'value', value), **racing) if racing is not None else None
+
+        self.pool = mp.Pool(self.num_workers, init_worker, (fitness_function, initializer, initargs, self.threshold))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self.terminate()
+
+    def evaluate(self, genomes):
+        '''
+        returns the fitness of every genome, in order
+        '''
+
+        if self.racing is not None:
+            self.racing.reset()
+
+        from tqdm import tqdm
+
+        # collect results as they complete, so racing thresholds are always up to date
+        try:
+            fitness_scores = [None] * len(genomes)
+            for i, (fitness, partial) in tqdm(self.pool.imap_unordered(evaluate_indexed, enumerate(genomes), self.chunksize), total=len(genomes), desc='[-] Evaluating', leave=False):
+                fitness_scores[i] = fitness
+                add_partial(genomes[i], partial)
+                if self.racing is not None:
+                    self.racing.record(fitness)
+            return fitness_scores
+        except KeyboardInterrupt:
+            self.terminate()
+            raise
+
+    def submit(self, genome):
+        '''
+        starts evaluating a single genome in the background - collect it with next_result
+        '''
+
+        self.pool.apply_async(
+            evaluate_genome, (genome,),
+            callback=lambda result: self.results.put((genome, result, None)),
+            error_callback=lambda error: self.results.put((genome, None, error))
+        )
+
+    def next_result(self):
+        '''
+        waits for any submitted genome to finish, returning it along with its fitness
+        '''
+
+        try:
+            genome, result, error = self.results.get()
+        except KeyboardInterrupt:
+            self.terminate()
+            raise
+
+        if error is not None:
+            raise error
+        fitness, partial = result
+        add_partial(genome, partial)
+        if self.racing is not None:
+            self.racing.record(fitness)
+        return genome, fitness
+
+    def close(self):
+        '''
+        waits for the workers to finish and shuts them down
+        '''
+
+        if self.pool is not None:
+            self.pool.close()
+            self.pool.join()
+            self.pool = None
+
+    def terminate(self):
+        '''
+        stops the workers immediately
+        '''
+
+        if self.pool is not None:
+            self.pool.terminate()
+            self.pool.join()
+            self.pool = None
@@ -1,47 +1,30 @@
 from sneat.population import Population
 from sneat.config import get_config
+from sneat.evaluator import Evaluator
+from sneat.checkpoint import save_checkpoint, load_checkpoint
+from sneat.cache import FitnessCache, CachedEvaluator
+from sneat.metrics import Metrics, ProfilerHook
 import numpy as np
 import pickle as pkl
-from tabulate import tabulate as tb
-from tqdm import tqdm
-import multiprocessing as mp
 
 def save_genome(genome, filename):
     with open(filename, 'wb') as f:
         pkl.dump(genome, f)
 
-def evaluate_genome(args):
-    g, ff = args
-    fitness = ff(g)
-    return fitness
-
-def evaluate_population(pop, ff):
+def evaluate_population(pop, evaluator):
     print('\n')
-    with mp.Pool(mp.cpu_count() - 1) as p:
-        # set the fitness of all genomes using evaluate_genome (which returns a single fitness score), and tqdm for multiprocessing
-        try:
-            fitness_scores = list(tqdm(p.imap(evaluate_genome, [(g, ff) for g in pop.genomes]), total=len(pop.genomes), desc='[-] Evaluating', leave=False))
-            for g, fitness in zip(pop.genomes, fitness_scores):
-                g.fitness = fitness
-        except KeyboardInterrupt:
-            p.terminate()
-            p.join()
-            return # exit early
+    genomes = pop.genomes
+    fitness_scores = evaluator.evaluate(genomes)
+    for g, fitness in zip(genomes, fitness_scores):
+        g.fitness = fitness
 
-def save_checkpoint(pop):
-    with open('checkpoint.pkl', 'wb') as f:
-        pkl.dump(pop, f)
+def maybe_save_checkpoint(pop):
+    interval = pop.config.evolution.checkpoint_interval
+    if interval and pop.generation % interval == 0:
+        save_checkpoint(pop, pop.config.evolution.checkpoint_path)
 
-def load_checkpoint():
-    try:
-        with open('checkpoint.pkl', 'rb') as f:
-            pop = pkl.load(f)
-            print(f'[+] Loaded checkpoint (gen. {pop.generation})')
-            return pop
-    except FileNotFoundError:
-        return None
-
-def print_stats(pop):
+def print_stats(pop, cache=None):
+    from tabulate import tabulate as tb
 
     # sort by fitness
     for s in pop.species:
@@ -55,6 +38,8 @@ def print_stats(pop):
     print(f'[i] Species: {len(pop.species)}')
     print(f'[i] Average fitness: {round(np.mean([g.fitness for g in pop.genomes]), 2)}')
     print(f'[i] Best fitness: {round(max(g.fitness for g in pop.genomes), 2)} (best ever: {round(pop.best_genome_seen.fitness, 2) if pop.best_genome_seen else 'N/A'})')
+    if cache is not None:
+        print(f'[i] Fitness cache: {cache.hits} hits, {cache.misses} misses ({len(cache)} entries)')
     print('-' * 88)
 
     # print species
@@ -63,57 +48,189 @@ def print_stats(pop):
     print(tb(data, headers=headers))
     print('-' * 88)
 
-def evolve(fitness_function):
-    config = get_config()
-    
-    pop = load_checkpoint() or Population()
+def update_best_genome(pop):
+    best = max(pop.genomes, key=lambda x: x.fitness)
 
-    max_generations = config.getint('Evolution', 'max_generations') or np.inf
-    max_fitness = config.getfloat('Evolution', 'max_fitness') or np.inf
+    if pop.best_genome_seen is None or best.fitness > pop.best_genome_seen.fitness:
+        new_best = best.clone()
+        print(f'\n\n[+] New best genome found with fitness: {round(new_best.fitness, 2)} (previous was {round(pop.best_genome_seen.fitness, 2) if pop.best_genome_seen else 'N/A'})')
+        pop.best_genome_seen = new_best
 
-    try:
-        for _ in range(max_generations):
-            
-            # evaluate population
-            evaluate_population(pop, fitness_function)
+    return best
 
-            # print stats
-            print_stats(pop)
+def save_winner(pop, message):
+    winner = max(pop.genomes, key=lambda x: x.fitness)
+    save_genome(winner, 'winner.pkl')
+    print(f'\n\n[+] {message}: {winner.fitness}\n\n')
+    return winner
 
-            # reproduce
-            print(f'[-] Reproducing...', end='\r', flush=True)
+def evolve_generational(pop, evaluator, max_generations, max_fitness, cache=None, metrics=None):
+    metrics = metrics or Metrics()
+
+    while True:
+        metrics.start_generation(pop.generation)
+        
+        # evaluate population
+        with metrics.phase('evaluate'):
+            evaluate_population(pop, evaluator)
+
+        # print stats
+        with metrics.phase('print_stats'):
+            print_stats(pop, cache)
+
+        # reproduce
+        print(f'[-] Reproducing...', end='\r', flush=True)
+        with metrics.phase('reproduce'):
             pop.reproduce()
-            print(f'[+] Reproduced                                   ')
+        print(f'[+] Reproduced                                   ')
+
+        # save checkpoint
+        with metrics.phase('checkpoint'):
+            maybe_save_checkpoint(pop)
+
+        best = update_best_genome(pop)
+        metrics.end_generation(pop)
+
+        if best.fitness >= max_fitness:
+            return save_winner(pop, 'Winner found with fitness')
+        
+        if pop.generation >= max_generations:
+            return save_winner(pop, 'Reached max generations, and achieved a fitness of')
+
+def evolve_steady_state(pop, evaluator, max_generations, max_fitness, cache=None, metrics=None):
+    '''
+    asynchronous, rtNEAT-style evolution: whenever an evaluation completes, that child
+    joins the population in place of the genome with the lowest adjusted fitness, and a
+    freshly bred child is sent straight back to the pool. a "generation" is counted
+    for every population_size evaluations
+    '''
+
+    population_size = pop.config.population.population_size
+    metrics = metrics or Metrics()
+    metrics.start_generation(pop.generation)
+
+    # the initial population is evaluated as a whole, once
+    with metrics.phase('evaluate'):
+        evaluate_population(pop, evaluator)
+    print_stats(pop, cache)
+
+    # the children out for evaluation, which still carry innovations the population may not
+    in_flight = {}
+    for _ in range(evaluator.num_workers):
+        child = pop.breed()
+        in_flight[child.id] = child
+        evaluator.submit(child)
+
+    evaluations = 0
+    while True:
+
+        # time spent waiting on the workers
+        with metrics.phase('evaluate'):
+            child, fitness = evaluator.next_result()
+        del in_flight[child.id]
+        child.fitness = fitness
+        with metrics.phase('reproduce'):
+            pop.insert(child)
+            child = pop.breed()
+        in_flight[child.id] = child
+        evaluator.submit(child)
+        evaluations += 1
+
+        best = update_best_genome(pop)
+
+        if best.fitness >= max_fitness:
+            evaluator.terminate()
+            return save_winner(pop, 'Winner found with fitness')
+
+        if evaluations % population_size == 0:
+            pop.advance_generation(in_flight.values())
+            with metrics.phase('print_stats'):
+                print_stats(pop, cache)
 
             # save checkpoint
-            if pop.generation % 10 == 0:
-                save_checkpoint(pop)
+            with metrics.phase('checkpoint'):
+                maybe_save_checkpoint(pop)
 
-            genomes = sorted(pop.genomes, key=lambda x: x.fitness, reverse=True)
-            best = genomes[0]
+            metrics.end_generation(pop)
+            metrics.start_generation(pop.generation)
 
-            if pop.best_genome_seen is None or best.fitness > pop.best_genome_seen.fitness:
-                new_best = best.clone()
-                print(f'\n\n[+] New best genome found with fitness: {round(new_best.fitness, 2)} (previous was {round(pop.best_genome_seen.fitness, 2) if pop.best_genome_seen else 'N/A'})')
-                pop.best_genome_seen = new_best
-
-            if best.fitness >= max_fitness:
-                winner = max(pop.genomes, key=lambda x: x.fitness)
-                save_genome(winner, 'winner.pkl')
-                print(f'\n\n[+] Winner found with fitness: {winner.fitness}\n\n')
-                return winner
-            
             if pop.generation >= max_generations:
+                evaluator.terminate()
+                return save_winner(pop, 'Reached max generations, and achieved a fitness of')
+
+def evolve(fitness_function, initializer=None, initargs=(), config=None, hooks=()):
+    '''
+    runs the evolution loop. the optional initializer is called with initargs once in
+    every worker process, before it evaluates anything. config replaces the one read
+    from the files, see Config.override. hooks are added to the metrics, see Metrics
+    '''
+
+    config = config or get_config()
+    
+    pop = load_checkpoint(config.evolution.checkpoint_path, config) or Population(config=config)
+
+    # stop evaluating genomes that can't catch up with the rest of their generation
+    racing = None
+    if config.evaluation.racing:
+        racing = {
+            'percentile': config.evaluation.racing_percentile,
+            'min_samples': config.evaluation.racing_min_samples,
+            'window': config.population.population_size
+        }
+
+    # remote workers load the fitness function and initializer themselves
+    if config.evaluation.backend == 'distributed':
+        from sneat.distributed import DistributedEvaluator
+        evaluator = DistributedEvaluator(
+            address=config.evaluation.address,
+            authkey=config.evaluation.authkey.encode(),
+            timeout=config.evaluation.worker_timeout,
+            num_workers=config.evaluation.num_workers,
+            racing=racing
+        )
+    else:
+        evaluator = Evaluator(
+            fitness_function,
+            num_workers=config.evaluation.num_workers,
+            chunksize=config.evaluation.chunksize,
+            initializer=initializer,
+            initargs=initargs,
+            racing=racing
+        )
+
+    # skip evaluating genes that have been evaluated before
+    cache = None
+    if config.evaluation.fitness_cache:
+        cache = FitnessCache(config.evaluation.cache_size, config.evaluation.cache_mode)
+        evaluator = CachedEvaluator(evaluator, cache)
+
+    # per-generation timings, written as json lines
+    hooks = list(hooks)
+    if config.metrics.profile_generations:
+        hooks.append(ProfilerHook(config.metrics.profile_generations, config.metrics.profile_path))
+    metrics = Metrics(
+        config.metrics.enabled,
+        path=config.metrics.path,
+        trace_memory=config.metrics.trace_memory,
+        hooks=hooks
+    )
+
+    max_generations = config.evolution.max_generations or np.inf
+    max_fitness = config.evolution.max_fitness or np.inf
+
+    # the evaluator waits for its workers when the run ends, and stops them right away if it fails
+    with evaluator:
+        try:
+            if config.evolution.mode == 'steady_state':
+                return evolve_steady_state(pop, evaluator, max_generations, max_fitness, cache, metrics)
+            return evolve_generational(pop, evaluator, max_generations, max_fitness, cache, metrics)
+                    
+        except KeyboardInterrupt:
+                evaluator.terminate()
                 winner = max(pop.genomes, key=lambda x: x.fitness)
+                print(f'\n\n[+] Best genome saved, with a fitness of {winner.fitness}\n')
                 save_genome(winner, 'winner.pkl')
-                print(f'\n\n[+] Reached max generations, and achieved a fitness of: {winner.fitness}\n\n')
                 return winner
-                
-    except KeyboardInterrupt:
-            winner = max(pop.genomes, key=lambda x: x.fitness)
-            print(f'\n\n[+] Best genome saved, with a fitness of {winner.fitness}\n')
-            save_genome(winner, 'winner.pkl')
-            return winner
 
-
-    
+        finally:
+            metrics.close()
@@ -0,0 +1,60 @@
+import numpy as np
+from .runtime import FORMAT_VERSION, ACTIVATIONS
+
+def export_genome(genome, path):
+    '''
+    freezes the genome's network into a .npz file that sneat.runtime can run with
+    nothing but numpy: the compiled layers as flat arrays, activation codes, and the
+    normalizer statistics as they are now (they're no longer updated after export)
+    '''
+
+    network = genome.network
+    plan = network.get_plan()
+    names = sorted(ACTIVATIONS)
+    codes = {name: i for i, name in enumerate(names)}
+
+    # renumber the values so the inputs come first, followed by each layer in turn,
+    # with the nodes of a layer sorted by activation function. the runtime can then
+    # work on contiguous slices instead of scattered indices
+    position = np.zeros(plan.num_values, dtype=np.intp)
+    position[plan.input_idx] = np.arange(len(plan.input_idx))
+    activation = np.zeros(plan.num_values, dtype=np.int8)
+    layers = []
+    offset = len(plan.input_idx)
+    for layer in plan.layers:
+        layer_codes = np.zeros(len(layer.nodes), dtype=np.int8)
+        for name, positions in layer.groups:
+            if name not in codes:
+                raise ValueError(f'Activation function {name} is not supported by the runtime')
+            layer_codes[positions] = codes[name]
+
+        order = np.argsort(layer_codes, kind='stable')
+        position[layer.nodes[order]] = np.arange(offset, offset + len(order))
+        activation[offset:offset + len(order)] = layer_codes[order]
+        layers.append((layer.sources, layer.weights[:, order], layer.bias[order]))
+        offset += len(order)
+
+    arrays = {
+        'version': np.array(FORMAT_VERSION),
+        'activation_names': np.array(names),
+        'num_inputs': np.array(len(plan.input_idx)),
+        'num_values': np.array(plan.num_values),
+        'output_idx': position[plan.output_idx],
+        'activation': activation,
+
+        # layer i computes values layer_ptr[i]:layer_ptr[i + 1] from the values at
+        # sources[source_ptr[i]:source_ptr[i + 1]], using the (sources x nodes) matrix
+        # flattened in weights[weight_ptr[i]:weight_ptr[i + 1]]
+        'layer_ptr': np.cumsum([len(plan.input_idx)] + [len(bias) for _, _, bias in layers]),
+        'source_ptr': np.cumsum([0] + [len(sources) for sources, _, _ in layers]),
+        'weight_ptr': np.cumsum([0] + [weights.size for _, weights, _ in layers]),
+        'sources': np.concatenate([position[sources] for sources, _, _ in layers] + [np.zeros(0, dtype=np.intp)]),
+        'weights': np.concatenate([weights.ravel() for _, weights, _ in layers] + [np.zeros(0)]),
+        'bias': np.concatenate([bias for _, _, bias in layers] + [np.zeros(0)])
+    }
+
+    if hasattr(network, 'normalizer'):
+        arrays['normalizer_mean'] = np.array(network.normalizer.mean, dtype=float)
+        arrays['normalizer_std'] = np.array(network.normalizer.std(), dtype=float)
+
+    np.savez(path, **arrays)
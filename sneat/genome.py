@@ -1,13 +1,24 @@
 from .neuralnetwork import NeuralNetwork
-from .config import get_config
 import numpy as np
 from copy import deepcopy
 import time
-import pickle
+import hashlib
+
+def match_genes(keys, other):
+    '''
+    positions of the keys (in list order) that also appear in other, a (sorted keys,
+    list positions) pair, along with their positions in the other list
+    '''
+
+    sorted_keys, order = other
+    if len(sorted_keys) == 0 or len(keys) == 0:
+        return np.zeros(0, dtype=np.intp), np.zeros(0, dtype=np.intp)
+    pos = np.minimum(np.searchsorted(sorted_keys, keys), len(sorted_keys) - 1)
+    found = np.flatnonzero(sorted_keys[pos] == keys)
+    return found, order[pos[found]]
 
 class Genome:
     def __init__(self, callbacks):
-        self.callbacks = callbacks
         self.fitness = 0
         self.normalized_fitness = 0
         self.adjusted_fitness = 0
@@ -16,59 +27,134 @@ class Genome:
 
     @staticmethod
     def crossover(g1, g2):
-        most_fit, least_fit = (g1, g2) if g1.fitness > g2.fitness else (g2, g1)
-        child = most_fit.clone()
-
-        # dicts for faster lookups
-        least_fit_conns = {c.innovation_number: c for c in least_fit.network.connections}
-        least_fit_nodes = {n.id: n for n in least_fit.network.nodes}
-
-        # inherit weights randomly from either parent
-        for c in child.network.connections:
-            if c.innovation_number in least_fit_conns:
-                c.weight = np.random.choice([c.weight, least_fit_conns[c.innovation_number].weight])
-
-        # the same goes for biases and activation functions
-        for n in child.network.nodes:
-            if n.id in least_fit_nodes:
-                n.bias = np.random.choice([n.bias, least_fit_nodes[n.id].bias])
-                n.activation = least_fit_nodes[n.id].activation
-
-        return child
-
-    def mutate(self):
-        mutation_rates = {
-            'add_node': self.callbacks['config'].getfloat('MutationRates', 'add_node'),
-            'add_connection': self.callbacks['config'].getfloat('MutationRates', 'add_connection'),
-            'change_weight': self.callbacks['config'].getfloat('MutationRates', 'change_weight'),
-            'change_activation': self.callbacks['config'].getfloat('MutationRates', 'change_activation'),
-            'toggle_connection': self.callbacks['config'].getfloat('MutationRates', 'toggle_connection'),
-            'change_bias': self.callbacks['config'].getfloat('MutationRates', 'change_bias'),
-            'remove_node': self.callbacks['config'].getfloat('MutationRates', 'remove_node')
-        }
+        return Genome.crossover_all([(g1, g2)])[0]
+
+    @staticmethod
+    def crossover_all(pairs):
+        '''
+        crosses over every (g1, g2) pair. each child is a copy of the fitter parent, inheriting
+        the weight of every connection (and the bias of every node) the parents share from
+        either parent at random, and the activation functions of the other parent. the genes
+        are matched up on arrays sorted by innovation number (and node id), and the coin
+        flips for all children are drawn at once
+        '''
+
+        genes = {} # id of a parent -> its gene arrays, as parents are picked many times over
+        children, matches = [], []
+        for g1, g2 in pairs:
+            most_fit, least_fit = (g1, g2) if g1.fitness > g2.fitness else (g2, g1)
+            for g in (most_fit, least_fit):
+                if id(g) not in genes:
+                    genes[id(g)] = g.gene_arrays()
+            children.append((most_fit.clone(), least_fit))
+            matches.append((match_genes(genes[id(most_fit)][0], genes[id(least_fit)][1]), match_genes(genes[id(most_fit)][2], genes[id(least_fit)][3])))
+
+        flips = iter((np.random.random(sum(len(c[0]) + len(n[0]) for c, n in matches)) < 0.5).tolist())
+        for (child, least_fit), ((c_idx, c_other), (n_idx, n_other)) in zip(children, matches):
+            connections = child.network.connections
+            for i, j in zip(c_idx.tolist(), c_other.tolist()):
+                if next(flips):
+                    connections[i].weight = least_fit.network.connections[j].weight
+            nodes = child.network.nodes
+            for i, j in zip(n_idx.tolist(), n_other.tolist()):
+                other = least_fit.network.nodes[j]
+                if next(flips):
+                    nodes[i].bias = other.bias
+                nodes[i].activation = other.activation
+            child.network.invalidate_plan()
+
+        return [child for child, _ in children]
+
+    def gene_arrays(self):
+        '''
+        the innovation numbers of the connections in list order, the same sorted along with
+        the list positions, and likewise for node ids
+        '''
+
+        innovations = np.array([c.innovation_number for c in self.network.connections], dtype=np.int64)
+        node_ids = np.array([n.id for n in self.network.nodes], dtype=np.int64)
+        c_order, n_order = np.argsort(innovations), np.argsort(node_ids)
+        return innovations, (innovations[c_order], c_order), node_ids, (node_ids[n_order], n_order)
+
+    def mutate(self, callbacks):
+        Genome.mutate_all([self], callbacks)
+
+    @staticmethod
+    def mutate_all(genomes, callbacks):
+        '''
+        applies one mutation to every genome, picked according to the mutation rates.
+        weight and bias changes are drawn for all genomes at once, structural
+        mutations are applied one genome at a time
+        '''
+
+        rates = callbacks['config'].mutation_rates
+        mutations = [rates.names[m] for m in np.random.choice(len(rates.names), size=len(genomes), p=rates.probabilities).tolist()]
 
-        total = sum(mutation_rates.values())
-        mutation_rates = {k: v / total for k, v in mutation_rates.items()}
-        mutation = np.random.choice(list(mutation_rates.keys()), p=list(mutation_rates.values()))
-
-        mutation_functions = {
-            'add_node': self.network.add_random_node,
-            'add_connection': self.network.add_random_connection,
-            'change_weight': self.network.change_random_weight,
-            'change_activation': self.network.change_random_activation,
-            'toggle_connection': self.network.toggle_random_connection,
-            'change_bias': self.network.change_random_bias,
-            'remove_node': self.network.remove_random_node
+        # a random enabled connection gets its weight nudged, a random non-input node its bias
+        candidates = {
+            'change_weight': [[c for c in g.network.connections if c.enabled] if m == 'change_weight' else [] for g, m in zip(genomes, mutations)],
+            'change_bias': [[n for n in g.network.nodes if n.node_type != 'input'] if m == 'change_bias' else [] for g, m in zip(genomes, mutations)]
         }
-        
-        mutation_functions[mutation]()
+        for name, attribute in (('change_weight', 'weight'), ('change_bias', 'bias')):
+            genes = [(g, options) for g, options in zip(genomes, candidates[name]) if options]
+            picks = (np.random.random(len(genes)) * [len(options) for _, options in genes]).astype(int).tolist()
+            for (g, options), pick, delta in zip(genes, picks, np.random.normal(-0.1, 0.1, len(genes)).tolist()):
+                gene = options[pick]
+                setattr(gene, attribute, getattr(gene, attribute) + delta)
+                g.network.invalidate_plan()
+
+        for g, mutation in zip(genomes, mutations):
+            if mutation == 'add_node':
+                g.network.add_random_node(callbacks)
+            elif mutation == 'add_connection':
+                g.network.add_random_connection(callbacks)
+            elif mutation == 'change_activation':
+                g.network.change_random_activation()
+            elif mutation == 'toggle_connection':
+                g.network.toggle_random_connection()
+            elif mutation == 'remove_node':
+                g.network.remove_random_node()
 
     def clone(self):
-        copy = pickle.loads(pickle.dumps(self))
+        copy = Genome.__new__(Genome)
+        copy.__dict__.update(self.__dict__)
+        copy.network = self.network.clone()
         return copy
 
+    def structural_hash(self):
+        '''
+        a digest of the genes (and normalizer statistics, if any). genomes with the
+        same hash compute the same function, whatever their ids
+        '''
+
+        h = hashlib.blake2b(digest_size=16)
+        self.network.hash_genes(h)
+        if hasattr(self.network, 'normalizer'):
+            normalizer = self.network.normalizer
+            for stats in (normalizer.n, normalizer.mean, normalizer.mean_diff, normalizer.var):
+                h.update(np.asarray(stats, dtype=float).tobytes())
+        return h.hexdigest()
+
     def activate(self, inputs):
         '''
         alias for network.feed_forward
         '''
-        return self.network.feed_forward(inputs)
\ No newline at end of file
+        return self.network.feed_forward(inputs)
+
+    def activate_batch(self, inputs):
+        '''
+        alias for network.activate_batch
+        '''
+        return self.network.activate_batch(inputs)
+
+    def step(self, inputs):
+        '''
+        alias for network.step
+        '''
+        return self.network.step(inputs)
+
+    def reset_state(self, batch_size=None):
+        '''
+        alias for network.reset_state
+        '''
+        self.network.reset_state(batch_size)
\ No newline at end of file
@@ -0,0 +1,84 @@
+import numpy as np
+from .config import activation_functions
+from .normalizer import SharedNormalizer
+
+class LockstepNetwork:
+    '''
+    packs the networks of many genomes into one block-sparse structure, so that
+    all of them can be activated together in a single call - one observation row
+    per genome, one action row out per genome.
+
+    the structure is a snapshot of the genomes at construction time, so it should
+    be rebuilt after every reproduction
+    '''
+
+    def __init__(self, genomes):
+        self.genomes = list(genomes)
+        plans = [g.network.get_plan() for g in self.genomes]
+
+        # every genome gets a contiguous block of the global value vector
+        offsets = np.cumsum([0] + [p.num_values for p in plans])
+        self.num_values = int(offsets[-1])
+        self.input_idx = np.array([p.input_idx + o for p, o in zip(plans, offsets)], dtype=np.intp)
+        self.output_idx = np.array([p.output_idx + o for p, o in zip(plans, offsets)], dtype=np.intp)
+
+        # merge the layers of equal depth across all genomes
+        self.layers = []
+        for d in range(max((len(p.layers) for p in plans), default=0)):
+            blocks = [(p.layers[d], o) for p, o in zip(plans, offsets) if d < len(p.layers)]
+            self.layers.append(PackedLayer(blocks))
+
+    def activate(self, observations):
+        '''
+        activates every genome on its own row of observations, returning
+        an array with one row of outputs per genome
+        '''
+
+        observations = np.asarray(observations, dtype=float)
+        if observations.shape != self.input_idx.shape:
+            raise ValueError(f'Wrong input shape. Expected {self.input_idx.shape}, but got {observations.shape}.')
+
+        # a shared normalizer takes every row at once, others have to be stepped one by one
+        shared = getattr(self.genomes[0].network, 'normalizer', None) if self.genomes else None
+        if isinstance(shared, SharedNormalizer) and all(getattr(g.network, 'normalizer', None) is shared for g in self.genomes):
+            shared.observe_batch(observations)
+            observations = shared.normalize(observations)
+        elif any(hasattr(g.network, 'normalizer') for g in self.genomes):
+            observations = observations.copy()
+            for i, g in enumerate(self.genomes):
+                if hasattr(g.network, 'normalizer'):
+                    g.network.normalizer.observe(observations[i])
+                    observations[i] = g.network.normalizer.normalize(observations[i])
+
+        values = np.zeros(self.num_values)
+        values[self.input_idx] = observations
+
+        for layer in self.layers:
+            x = np.bincount(layer.dst, weights=values[layer.src] * layer.weight, minlength=len(layer.nodes)) + layer.bias
+            for name, positions in layer.groups:
+                x[positions] = activation_functions[name](x[positions])
+            values[layer.nodes] = x
+
+        return values[self.output_idx]
+
+class PackedLayer:
+    '''
+    the layers of equal depth from several plans, concatenated into coordinate
+    arrays over the global value vector
+    '''
+
+    def __init__(self, blocks):
+        sizes = np.cumsum([0] + [len(layer.nodes) for layer, _ in blocks])
+        self.nodes = np.concatenate([layer.nodes + o for layer, o in blocks])
+        self.bias = np.concatenate([layer.bias for layer, _ in blocks])
+        self.src = np.concatenate([layer.src + o for layer, o in blocks])
+        self.dst = np.concatenate([layer.dst + s for (layer, _), s in zip(blocks, sizes)])
+        self.weight = np.concatenate([layer.weight for layer, _ in blocks])
+
+        # group every node in the packed layer by activation function
+        positions = {}
+        for (layer, _), s in zip(blocks, sizes):
+            for name, pos in layer.groups:
+                pos = np.arange(len(layer.nodes))[pos] + s
+                positions.setdefault(name, []).append(pos)
+        self.groups = [(name, np.concatenate(pos)) for name, pos in sorted(positions.items())]
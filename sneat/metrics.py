@@ -0,0 +1,190 @@
+import collections
+import contextlib
+import cProfile
+import functools
+import json
+import time
+import tracemalloc
+import numpy as np
+from .genome import Genome
+from .neuralnetwork import NeuralNetwork
+from .plan import Plan
+from .population import Population, GeneticEncoding
+
+# the functions timed while metrics are enabled. they're only wrapped for the
+# duration of a run with metrics on, so there's no overhead otherwise.
+# note that only calls in the main process are seen, not those in evaluation workers
+HOT_FUNCTIONS = [
+    (Population, 'reproduce'),
+    (Population, 'speciate'),
+    (Population, 'breed'),
+    (Population, 'insert'),
+    (Population, 'advance_generation'),
+    (GeneticEncoding, '__init__'),
+    (GeneticEncoding, 'distances_to'),
+    (Genome, 'clone'),
+    (Genome, 'crossover_all'),
+    (Genome, 'mutate_all'),
+    (NeuralNetwork, 'would_create_cycle'),
+    (Plan, '__init__')
+]
+
+class Metrics:
+    '''
+    collects wall time and call counts for the phases of the evolution loop and for
+    the hot functions in HOT_FUNCTIONS, along with peak memory (if trace_memory is set)
+    and the distribution of genome sizes. one json line is appended to path per generation.
+
+    hooks are objects with on_generation_start(generation) and
+    on_generation_end(generation, record) methods, see ProfilerHook
+    '''
+
+    def __init__(self, enabled=False, path='metrics.jsonl', trace_memory=False, hooks=()):
+        self.enabled = enabled
+        self.path = path
+        self.trace_memory = trace_memory
+        self.hooks = list(hooks)
+        self.timings = collections.defaultdict(float)
+        self.calls = collections.defaultdict(int)
+        self.originals = []
+        self.generation = None
+        self.started = None
+        self.file = None
+
+        if self.enabled:
+            self.file = open(self.path, 'a')
+            if self.trace_memory:
+                tracemalloc.start()
+            self.instrument()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def record_call(self, name, seconds):
+        self.timings[name] += seconds
+        self.calls[name] += 1
+
+    def phase(self, name):
+        '''
+        a context manager that times the enclosed block as the named phase
+        '''
+
+        if not self.enabled:
+            return contextlib.nullcontext()
+        return self.timed_phase(name)
+
+    @contextlib.contextmanager
+    def timed_phase(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record_call(name, time.perf_counter() - start)
+
+    def instrument(self):
+        for cls, name in HOT_FUNCTIONS:
+            original = cls.__dict__[name]
+            is_static = isinstance(original, staticmethod)
+            wrapper = self.wrap(f'{cls.__name__}.{name}', original.__func__ if is_static else original)
+            setattr(cls, name, staticmethod(wrapper) if is_static else wrapper)
+            self.originals.append((cls, name, original))
+
+    def uninstrument(self):
+        for cls, name, original in reversed(self.originals):
+            setattr(cls, name, original)
+        self.originals = []
+
+    def wrap(self, name, fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                self.record_call(name, time.perf_counter() - start)
+        return wrapper
+
+    def start_generation(self, generation):
+        if not self.enabled:
+            return
+
+        self.generation = generation
+        self.started = time.perf_counter()
+        self.timings.clear()
+        self.calls.clear()
+        if self.trace_memory:
+            tracemalloc.reset_peak()
+        for hook in self.hooks:
+            hook.on_generation_start(generation)
+
+    def end_generation(self, pop):
+        '''
+        writes the metrics of the generation started with start_generation
+        '''
+
+        if not self.enabled or self.generation is None:
+            return
+
+        genomes = pop.genomes
+        record = {
+            'generation': self.generation,
+            'wall_time': time.perf_counter() - self.started,
+            'timings': {name: {'seconds': self.timings[name], 'calls': self.calls[name]} for name in sorted(self.timings)},
+            'peak_memory': tracemalloc.get_traced_memory()[1] if self.trace_memory else None,
+            'population_size': len(genomes),
+            'species': len(pop.species),
+            'nodes': distribution([len(g.network.nodes) for g in genomes]),
+            'connections': distribution([len(g.network.connections) for g in genomes]),
+            'enabled_connections': distribution([sum(c.enabled for c in g.network.connections) for g in genomes])
+        }
+
+        for hook in self.hooks:
+            hook.on_generation_end(self.generation, record)
+
+        self.file.write(json.dumps(record) + '\n')
+        self.file.flush()
+        self.generation = None
+
+    def close(self):
+        if self.enabled:
+            self.uninstrument()
+            if self.trace_memory:
+                tracemalloc.stop()
+            self.file.close()
+            self.enabled = False
+
+class ProfilerHook:
+    '''
+    runs cProfile over the selected generations, dumping the stats of each to
+    path (formatted with the generation number) for inspection with pstats or snakeviz
+    '''
+
+    def __init__(self, generations, path='profile-{generation}.prof'):
+        self.generations = set(generations)
+        self.path = path
+        self.profiler = None
+
+    def on_generation_start(self, generation):
+        if generation in self.generations:
+            self.profiler = cProfile.Profile()
+            self.profiler.enable()
+
+    def on_generation_end(self, generation, record):
+        if self.profiler is not None:
+            self.profiler.disable()
+            self.profiler.dump_stats(self.path.format(generation=generation))
+            self.profiler = None
+
+def distribution(values):
+    if not values:
+        return None
+    return {
+        'mean': float(np.mean(values)),
+        'min': int(np.min(values)),
+        'p50': float(np.percentile(values, 50)),
+        'p90': float(np.percentile(values, 90)),
+        'max': int(np.max(values))
+    }
@@ -1,109 +1,235 @@
 import numpy as np
-from .config import activation_functions
+from .config import activation_names
 from .normalizer import Normalizer
-import networkx as nx
-import matplotlib.pyplot as plt
+from .plan import Plan, RecurrentPlan
+from .codegen import compile_network
+
+def pick(options):
+    '''
+    a random element of the list, drawn by index - np.random.choice would first turn
+    the list into an array. raises ValueError if the list is empty
+    '''
+
+    return options[np.random.randint(len(options))]
 
 class NeuralNetwork:
+    '''
+    the network only holds its genes - services such as the config and the
+    innovation registry are passed in as "callbacks" by the operations that need them
+    '''
+
     def __init__(self, callbacks):
-        if callbacks['config'].getboolean('NeuralNetwork', 'use_normalizer'):
-            self.normalizer = Normalizer(callbacks['config'].getint('NeuralNetwork', 'num_inputs'))
+        config = callbacks['config'].neural_network
+        if config.use_normalizer:
+            # the population passes its normalizer along if it's shared
+            self.normalizer = callbacks.get('normalizer') or Normalizer(config.num_inputs)
         self.node_counter = 0
         self.nodes, self.connections = [], []
-        self.callbacks = callbacks # this should contain the "find_or_create_innovation" method
-        self.initialize(callbacks['config'].getint('NeuralNetwork', 'num_inputs'), callbacks['config'].getint('NeuralNetwork', 'num_outputs'))
+        self.plan = None
+        self.recurrent_plan = None
+        self.compiled = None
+        self.state = None # activation state of step(), allocated on first use
+        self.backend = config.backend
+        self.adjacency = {} # node id -> ids of the nodes it feeds through enabled connections
+        self.initialize(config.num_inputs, config.num_outputs, callbacks)
+
+    def __getstate__(self):
+        # the plans and adjacency are derived from the genes, so leave them out of pickles (with the activation state).
+        # compiled code is kept, it's pickled as its source
+        state = self.__dict__.copy()
+        state['plan'] = None
+        state['recurrent_plan'] = None
+        state['state'] = None
+        state['adjacency'] = None
+        return state
+
+    def clone(self):
+        '''
+        copies the genes, sharing everything that is never modified in place
+        '''
+
+        copy = NeuralNetwork.__new__(NeuralNetwork)
+        copy.__dict__.update(self.__dict__)
+        nodes = {n.id: n.copy() for n in self.nodes}
+        copy.nodes = list(nodes.values())
+        copy.connections = [c.copy(nodes[c.in_node.id], nodes[c.out_node.id]) for c in self.connections]
+        copy.adjacency = {k: set(v) for k, v in self.get_adjacency().items()}
+        if hasattr(self, 'normalizer'):
+            copy.normalizer = self.normalizer.copy()
+
+        # plans are replaced rather than modified, so both networks can share one until either mutates
+        copy.plan = getattr(self, 'plan', None)
+        copy.recurrent_plan = getattr(self, 'recurrent_plan', None)
+        copy.compiled = getattr(self, 'compiled', None)
+        copy.state = None
+        return copy
 
     def next_node_id(self):
         self.node_counter += 1
         return self.node_counter
 
-    def initialize(self, num_input, num_output):
-        self.nodes = [Node(self.next_node_id(), node_type='input', callbacks=self.callbacks) for _ in range(num_input)]
-        self.nodes += [Node(self.next_node_id(), node_type='output', callbacks=self.callbacks) for _ in range(num_output)]
+    def initialize(self, num_input, num_output, callbacks):
+        input_activation = callbacks['config'].neural_network.input_activation
+        output_activation = callbacks['config'].neural_network.output_activation
+        self.nodes = [Node(self.next_node_id(), node_type='input', activation=input_activation) for _ in range(num_input)]
+        self.nodes += [Node(self.next_node_id(), node_type='output', activation=output_activation) for _ in range(num_output)]
 
         # connect some inputs to outputs
         for in_node in [n for n in self.nodes if n.node_type == 'input']:
             for out_node in [n for n in self.nodes if n.node_type == 'output' and np.random.uniform() < 0.5]:
-                innovation_number = self.callbacks['find_or_create_innovation'](in_node, out_node)
-                self.add_connection(in_node, out_node)
+                self.add_connection(in_node, out_node, callbacks)
 
     def feed_forward(self, inputs):
         # check if inputs match the number of input nodes
-        input_nodes = [n for n in self.nodes if n.node_type == 'input']
-        if len(inputs) != len(input_nodes):
-            raise ValueError(f'Wrong input shape. Expected {len(input_nodes)} inputs, but got {len(inputs)}.')
+        plan = self.get_plan()
+        if len(inputs) != len(plan.input_idx):
+            raise ValueError(f'Wrong input shape. Expected {len(plan.input_idx)} inputs, but got {len(inputs)}.')
 
         if hasattr(self, 'normalizer'):
             self.normalizer.observe(inputs)
             inputs = self.normalizer.normalize(inputs)
 
-        # convert inputs to np array
-        inputs = np.array(inputs)
+        if getattr(self, 'backend', 'plan') == 'codegen':
+            return self.get_compiled()(inputs.tolist() if hasattr(inputs, 'tolist') else inputs)
 
-        # reset node values
-        for node in self.nodes:
-            node.value = 0.0
-            node.ready = False
+        # return output values
+        return list(plan.activate(inputs))
 
-        node_dict = {node.id: node for node in self.nodes}
+    def activate_batch(self, inputs):
+        '''
+        feeds a whole batch of inputs (one row per sample) through the network at once,
+        returning one row of outputs per sample
+        '''
 
-        # assign input values
-        for node, input_value in zip(input_nodes, inputs):
-            node_dict[node.id].value = input_value
-            node_dict[node.id].ready = True
+        plan = self.get_plan()
+        inputs = np.asarray(inputs, dtype=float)
+        if inputs.ndim != 2 or inputs.shape[1] != len(plan.input_idx):
+            raise ValueError(f'Wrong input shape. Expected (batch, {len(plan.input_idx)}), but got {inputs.shape}.')
 
-        # assign hidden and output values
-        while not all(node.ready for node in node_dict.values()):
-            for node in node_dict.values():
-                if node.ready:
-                    continue
+        if hasattr(self, 'normalizer'):
+            self.normalizer.observe_batch(inputs)
+            inputs = self.normalizer.normalize(inputs)
 
-                # get the incoming connections
-                incoming_connections = [c for c in self.connections if c.out_node == node and c.enabled]
+        return plan.activate(inputs)
 
-                if not incoming_connections:
-                    node.ready = True
-                    node.value = activation_functions[node.activation](node.value)
-                    continue
+    def step(self, inputs):
+        '''
+        advances the network by one tick, returning its outputs. recurrent connections
+        carry the values of the previous tick, kept in a persistent state until reset_state().
+        takes a single input vector, or a batch of them (one row per episode) with one state
+        per row - the state is reset whenever the shape of the inputs changes
+        '''
 
-                # check if all incoming connections are ready
-                if all(node_dict[c.in_node.id].ready for c in incoming_connections):
-                    # calc node value
-                    node_dict[node.id].value = np.sum([node_dict[c.in_node.id].value * c.weight for c in incoming_connections]) + node_dict[node.id].bias
-                    node_dict[node.id].value = activation_functions[node.activation](node_dict[node.id].value)
-                    node.ready = True
+        plan = self.get_recurrent_plan()
+        inputs = np.asarray(inputs, dtype=float)
+        if inputs.ndim not in (1, 2) or inputs.shape[-1] != plan.num_inputs:
+            raise ValueError(f'Wrong input shape. Expected ({plan.num_inputs},) or (batch, {plan.num_inputs}), but got {inputs.shape}.')
 
-        # return output values
-        output_nodes = [node for node in self.nodes if node.node_type == 'output']
-        return [node_dict[node.id].value for node in output_nodes]
+        if hasattr(self, 'normalizer'):
+            if inputs.ndim == 2:
+                self.normalizer.observe_batch(inputs)
+            else:
+                self.normalizer.observe(inputs)
+            inputs = self.normalizer.normalize(inputs)
+
+        if getattr(self, 'state', None) is None or self.state[0].shape != inputs.shape[:-1] + (plan.num_values,):
+            self.reset_state(inputs.shape[0] if inputs.ndim == 2 else None)
+        return plan.step(inputs, self.state)
+
+    def reset_state(self, batch_size=None):
+        '''
+        zeroes the activation state used by step(), e.g. between episodes. with a batch
+        size, one state is kept per row of inputs
+        '''
+
+        shape = () if batch_size is None else (batch_size,)
+        self.state = self.get_recurrent_plan().allocate(shape)
+
+    def is_recurrent(self):
+        '''
+        whether any enabled connection closes a cycle (or loops back on its node)
+        '''
+
+        return self.get_recurrent_plan().recurrent
 
-    def add_random_node(self):
+    def get_recurrent_plan(self):
+        '''
+        returns the step plan, building it if the network changed since last call
+        '''
+
+        if getattr(self, 'recurrent_plan', None) is None:
+            self.recurrent_plan = RecurrentPlan(self.nodes, self.connections)
+        return self.recurrent_plan
+
+    def get_compiled(self):
+        '''
+        returns the network compiled into a python function (see sneat.codegen),
+        compiling it if the network changed since last call
+        '''
+
+        if getattr(self, 'compiled', None) is None:
+            self.compiled = compile_network(self)
+        return self.compiled
+
+    def hash_genes(self, h):
+        '''
+        feeds the node and connection genes into the hash object h
+        '''
+
+        nodes = sorted(self.nodes, key=lambda n: n.id)
+        connections = sorted(self.connections, key=lambda c: c.innovation_number)
+        h.update(np.array([n.id for n in nodes], dtype=np.int64).tobytes())
+        h.update(np.array([n.bias for n in nodes], dtype=float).tobytes())
+        h.update(' '.join(f'{n.node_type}:{n.activation}' for n in nodes).encode())
+        h.update(np.array([(c.innovation_number, c.in_node.id, c.out_node.id, c.enabled) for c in connections], dtype=np.int64).tobytes())
+        h.update(np.array([c.weight for c in connections], dtype=float).tobytes())
+
+    def get_plan(self):
+        '''
+        returns the compiled execution plan, building it if the network changed since last call
+        '''
+
+        if getattr(self, 'plan', None) is None:
+            self.plan = Plan(self.nodes, self.connections)
+        return self.plan
+
+    def invalidate_plan(self):
+        '''
+        drops the compiled execution plans - must be called whenever nodes or connections change
+        '''
+
+        self.plan = None
+        self.recurrent_plan = None
+        self.compiled = None
+        self.state = None
+
+    def add_random_node(self, callbacks):
         '''
         inserts a new node onto a random connection,
         splitting it in two
         '''
 
         try:
-            connection = np.random.choice([c for c in self.connections if c.enabled])
+            connection = pick([c for c in self.connections if c.enabled])
         except ValueError:
             return
 
-        new_node = Node(self.next_node_id(), node_type='hidden', callbacks=self.callbacks)
+        new_node = Node(self.next_node_id(), node_type='hidden')
 
         # create two new connections
         in_node = connection.in_node
         out_node = connection.out_node
-        innovation_number1 = self.callbacks['find_or_create_innovation'](in_node, new_node)
-        innovation_number2 = self.callbacks['find_or_create_innovation'](new_node, out_node)
         try:
             self.nodes.append(new_node)
-            self.add_connection(in_node, new_node)
-            self.add_connection(new_node, out_node)
-            connection.enabled = False
+            self.add_connection(in_node, new_node, callbacks)
+            self.add_connection(new_node, out_node, callbacks)
+            self.set_enabled(connection, False)
         except ValueError:
             return
+        finally:
+            self.invalidate_plan()
 
-    def add_random_connection(self):
+    def add_random_connection(self, callbacks):
         '''
         creates a random connection between two nodes
         '''
@@ -111,11 +237,13 @@ class NeuralNetwork:
         retries = 0
         max_retries = 10
 
+        # recurrent networks may also feed their outputs back
+        recurrent = callbacks['config'].neural_network.recurrent
         while retries < max_retries:
-            in_node = np.random.choice([n for n in self.nodes if n.node_type != 'output'])
-            out_node = np.random.choice([n for n in self.nodes if n.node_type != 'input'])
+            in_node = pick([n for n in self.nodes if recurrent or n.node_type != 'output'])
+            out_node = pick([n for n in self.nodes if n.node_type != 'input'])
             try:
-                self.add_connection(in_node, out_node)
+                self.add_connection(in_node, out_node, callbacks)
                 break
             except ValueError:
                 retries += 1
@@ -129,11 +257,14 @@ class NeuralNetwork:
         if not hidden_nodes:
             return
 
-        node = np.random.choice(hidden_nodes)
+        node = pick(hidden_nodes)
         conns = [c for c in self.connections if c.in_node == node or c.out_node == node]
         for conn in conns:
+            self.set_enabled(conn, False)
             self.connections.remove(conn)
         self.nodes.remove(node)
+        self.get_adjacency().pop(node.id, None)
+        self.invalidate_plan()
 
     def change_random_weight(self):
         '''
@@ -144,8 +275,9 @@ class NeuralNetwork:
         if not connections:
             return
 
-        connection = np.random.choice(connections)
-        connection.weight += np.random.normal(-0.1, 0.1)
+        connection = pick(connections)
+        connection.weight += float(np.random.normal(-0.1, 0.1))
+        self.invalidate_plan()
 
     def change_random_bias(self):
         '''
@@ -156,8 +288,9 @@ class NeuralNetwork:
         if not nodes:
             return
 
-        node = np.random.choice(nodes)
-        node.bias += np.random.normal(-0.1, 0.1)
+        node = pick(nodes)
+        node.bias += float(np.random.normal(-0.1, 0.1))
+        self.invalidate_plan()
 
     def change_random_activation(self):
         '''
@@ -168,8 +301,9 @@ class NeuralNetwork:
         if not nodes:
             return
 
-        node = np.random.choice(nodes)
-        node.activation = np.random.choice(list(activation_functions.keys()))
+        node = pick(nodes)
+        node.activation = pick(activation_names)
+        self.invalidate_plan()
 
     def toggle_random_connection(self):
         '''
@@ -180,44 +314,80 @@ class NeuralNetwork:
         if not connections:
             return
 
-        connection = np.random.choice(connections)
-        connection.enabled = not connection.enabled
+        connection = pick(connections)
+        self.set_enabled(connection, not connection.enabled)
 
-    def add_connection(self, in_node, out_node):
+    def add_connection(self, in_node, out_node, callbacks):
         # check if connection already exists
         if any(c.in_node == in_node and c.out_node == out_node for c in self.connections):
             raise ValueError('Connection already exists')
 
-        # check if connection creates cycles
-        if self.would_create_cycle(in_node, out_node):
+        # check if connection creates cycles, unless they're allowed
+        recurrent = callbacks['config'].neural_network.recurrent
+        if not recurrent and self.would_create_cycle(in_node, out_node):
             raise ValueError('Connection would create a cycle')
 
         # create the connection
-        innovation_number = self.callbacks['find_or_create_innovation'](in_node, out_node)
-        self.connections.append(Connection(innovation_number, in_node, out_node))
+        innovation_number = callbacks['find_or_create_innovation'](in_node, out_node)
+        self.connections.append(Connection(innovation_number, in_node, out_node, recurrent=recurrent))
+        self.get_adjacency().setdefault(in_node.id, set()).add(out_node.id)
+        self.invalidate_plan()
 
-    def would_create_cycle(self, in_node, out_node):
+    def set_enabled(self, connection, enabled):
         '''
-        checks if adding a connection between two nodes would create a cycle
+        enables or disables a connection, keeping the adjacency in sync
         '''
 
-        # create a graph from the connections
-        G = nx.DiGraph()
-        for connection in self.connections:
-            if connection.enabled:
-                G.add_edge(connection.in_node.id, connection.out_node.id)
+        connection.enabled = enabled
+        successors = self.get_adjacency().setdefault(connection.in_node.id, set())
+        if enabled:
+            successors.add(connection.out_node.id)
+        else:
+            successors.discard(connection.out_node.id)
+        self.invalidate_plan()
 
-        # add the new connection
-        G.add_edge(in_node.id, out_node.id)
+    def get_adjacency(self):
+        '''
+        returns the adjacency of enabled connections, rebuilding it for networks
+        that were pickled before it was tracked
+        '''
 
-        # check if the graph has a cycle
-        try:
-            nx.find_cycle(G)
+        if getattr(self, 'adjacency', None) is None:
+            self.adjacency = {}
+            for c in self.connections:
+                if c.enabled:
+                    self.adjacency.setdefault(c.in_node.id, set()).add(c.out_node.id)
+        return self.adjacency
+
+    def would_create_cycle(self, in_node, out_node):
+        '''
+        checks if adding a connection between two nodes would create a cycle,
+        i.e. if in_node can already be reached from out_node
+        '''
+
+        if in_node.id == out_node.id:
             return True
-        except nx.exception.NetworkXNoCycle:
-            return False
+
+        adjacency = self.get_adjacency()
+        stack, seen = [out_node.id], {out_node.id}
+        while stack:
+            for successor in adjacency.get(stack.pop(), ()):
+                if successor == in_node.id:
+                    return True
+                if successor not in seen:
+                    seen.add(successor)
+                    stack.append(successor)
+
+        return False
 
     def visualize(self):
+        # plotting is optional, so only load it when asked to
+        try:
+            import networkx as nx
+            import matplotlib.pyplot as plt
+        except ImportError:
+            raise ImportError('Visualization needs matplotlib and networkx, install them with `pip install sneat[visualize]`') from None
+
         G = nx.DiGraph()
 
         # Add nodes to the graph
@@ -228,8 +398,8 @@ class NeuralNetwork:
                 G.add_node(node.id, pos=(1, node.id))
             else:
                 # Generate random position for hidden nodes
-                x = rng.uniform(0.2, 0.8)
-                y = rng.uniform(0, 3)
+                x = np.random.uniform(0.2, 0.8)
+                y = np.random.uniform(0, 3)
                 G.add_node(node.id, pos=(x, y))
 
         # Add edges to the graph
@@ -258,40 +428,49 @@ class NeuralNetwork:
         plt.show()
 
 class Node:
-    def __init__(self, id=None, node_type='hidden', activation=None, callbacks=None):
+    __slots__ = ('id', 'node_type', 'bias', 'activation')
+
+    def __init__(self, id=None, node_type='hidden', activation=None):
         if not id:
             raise ValueError('Node must have an id')
 
         self.id = id
         self.node_type = node_type
         self.bias = np.random.uniform(-1, 1)
-        self.callbacks = callbacks
-        self.activation = self.initialize_activation()
-        self.value = 0.0
-        self.ready = False
 
-    def initialize_activation(self):
-        type_to_activation = {
-            'input': self.callbacks['config'].get('NeuralNetwork', 'input_activation'),
-            'output': self.callbacks['config'].get('NeuralNetwork', 'output_activation'),
-            'hidden': np.random.choice(list(activation_functions.keys())) }
+        # hidden nodes get a random activation function, unless one is given
+        self.activation = activation or pick(activation_names)
 
-        # get the name of the activation function we'll use
-        activation_name = type_to_activation[self.node_type]
-        return activation_name
+    def copy(self):
+        node = Node.__new__(Node)
+        node.id, node.node_type, node.bias, node.activation = self.id, self.node_type, self.bias, self.activation
+        return node
 
 class Connection:
-    def __init__(self, innovation_number, in_node, out_node, enabled=True):
+    __slots__ = ('innovation_number', 'in_node', 'out_node', 'weight', 'enabled')
+
+    def __init__(self, innovation_number, in_node, out_node, enabled=True, recurrent=False):
         self.in_node = in_node
         self.out_node = out_node
         self.innovation_number = innovation_number
         self.weight = np.random.uniform(-1, 1)
         self.enabled = enabled      
 
-        if self.in_node.node_type == 'output':
+        # recurrent networks may feed outputs back, and loop nodes onto themselves
+        if self.in_node.node_type == 'output' and not recurrent:
             raise ValueError('Output nodes cannot have outgoing connections')
         if self.out_node.node_type == 'input':
             raise ValueError('Input nodes cannot have incoming connections')
-        if self.in_node == self.out_node:
+        if self.in_node == self.out_node and not recurrent:
             raise ValueError('Connection cannot be made between the same node')
 
+    def copy(self, in_node, out_node):
+        '''
+        copies the connection onto the given (copied) end nodes, skipping validation
+        '''
+
+        connection = Connection.__new__(Connection)
+        connection.innovation_number, connection.weight, connection.enabled = self.innovation_number, self.weight, self.enabled
+        connection.in_node, connection.out_node = in_node, out_node
+        return connection
+
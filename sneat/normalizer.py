@@ -1,6 +1,10 @@
 import numpy as np
+from copy import deepcopy
 
 class Normalizer:
+    '''
+    running mean and variance of every input, used to standardize them
+    '''
 
     def __init__(self, size):
         self.n = np.zeros(size)
@@ -8,14 +12,135 @@ class Normalizer:
         self.mean_diff = np.zeros(size)
         self.var = np.zeros(size)
 
+    def copy(self):
+        return deepcopy(self)
+
     def observe(self, x):
         self.n += 1.0
-        last_mean = self.mean.copy()
-        self.mean += (x - self.mean) / self.n
-        self.mean_diff += (x - last_mean) * (x - self.mean)
+        delta = x - self.mean
+        self.mean += delta / self.n
+        self.mean_diff += delta * (x - self.mean)
+        self.update_var()
+
+    def observe_batch(self, x):
+        '''
+        observes a batch of samples (one per row) at once, merging the
+        batch statistics into the running ones
+        '''
+
+        if len(x) == 0:
+            return
+
+        batch_mean = x.mean(axis=0)
+        self.merge(len(x), batch_mean, ((x - batch_mean) ** 2).sum(axis=0))
+
+    def merge(self, n, mean, mean_diff):
+        '''
+        merges the statistics of another set of samples into these (chan et al.)
+        '''
+
+        total = self.n + n
+        share = np.divide(n, total, out=np.zeros_like(total), where=total > 0)
+        delta = mean - self.mean
+        self.mean += delta * share
+        self.mean_diff += mean_diff + delta ** 2 * self.n * share
+        self.n = total
+        self.update_var()
+
+    def update_var(self):
+        # the variance a genome normalizes with only ever gets floored, as it always has
         self.var = np.maximum(self.var, 1e-2)
 
+    def sample_var(self):
+        '''
+        the variance of the samples observed so far, from the accumulated squared differences
+        '''
+
+        return np.divide(self.mean_diff, self.n, out=np.zeros_like(self.mean_diff), where=self.n > 0)
+
+    def statistics(self):
+        return self.n.copy(), self.mean.copy(), self.mean_diff.copy()
+
+    def std(self):
+        return np.sqrt(np.maximum(self.var, 1e-2))
+
+    def normalize(self, inputs):
+        return (inputs - self.mean) / self.std()
+
+class SharedNormalizer(Normalizer):
+    '''
+    one normalizer for a whole population. inputs are normalized with statistics that
+    are frozen for the generation, while the samples observed during it are collected
+    as partial statistics - per worker process - and merged in by advance() once the
+    generation is over. until then, the first generation sees its inputs as they are
+    '''
+
+    def __init__(self, size):
+        super().__init__(size)
+        self.pending = Normalizer(size)
+        self.freeze()
+
+    def __getstate__(self):
+        # pickles only carry the frozen statistics, so a worker sends back nothing but what it observed
+        state = self.__dict__.copy()
+        state['pending'] = None
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.pending = Normalizer(len(self.mean))
+
+    def copy(self):
+        return self
+
+    def freeze(self):
+        self.scale = np.where(self.n > 0, np.sqrt(np.maximum(self.sample_var(), 1e-2)), 1.0)
+
+    def observe(self, x):
+        self.pending.observe(x)
+
+    def observe_batch(self, x):
+        self.pending.observe_batch(x)
+
+    def std(self):
+        return self.scale
+
     def normalize(self, inputs):
-        obs_mean = self.mean
-        obs_std = np.sqrt(self.var)
-        return (inputs - obs_mean) / obs_std
\ No newline at end of file
+        return (inputs - self.mean) / self.scale
+
+    def take_partial(self):
+        '''
+        returns the statistics observed in this process since the last call, or None
+        '''
+
+        if not self.pending.n.any():
+            return None
+        partial = self.pending.statistics()
+        self.pending = Normalizer(len(self.mean))
+        return partial
+
+    def add_partial(self, partial):
+        self.pending.merge(*partial)
+
+    def advance(self):
+        '''
+        merges everything observed during the generation into the frozen statistics
+        '''
+
+        self.merge(*self.pending.statistics())
+        self.pending = Normalizer(len(self.mean))
+        self.freeze()
+
+def take_partial(genome):
+    '''
+    the partial statistics a worker sends back along with the fitness of a genome
+    '''
+
+    normalizer = getattr(genome.network, 'normalizer', None)
+    if isinstance(normalizer, SharedNormalizer):
+        return normalizer.take_partial()
+    return None
+
+def add_partial(genome, partial):
+    if partial is not None:
+        genome.network.normalizer.add_partial(partial)
@@ -0,0 +1,207 @@
+import numpy as np
+from .config import activation_functions
+
+class Plan:
+    '''
+    topologically ordered, array-backed execution plan for a feed-forward network.
+    values are indexed by the position of each node in the network's node list,
+    and nodes are grouped into layers by their depth in the graph
+    '''
+
+    def __init__(self, nodes, connections):
+        index = {node.id: i for i, node in enumerate(nodes)}
+        self.num_values = len(nodes)
+        self.input_idx = np.array([i for i, n in enumerate(nodes) if n.node_type == 'input'], dtype=np.intp)
+        self.output_idx = np.array([i for i, n in enumerate(nodes) if n.node_type == 'output'], dtype=np.intp)
+
+        # incoming (source, weight) pairs for every node, ignoring disabled connections
+        incoming = [[] for _ in nodes]
+        outgoing = [[] for _ in nodes]
+        for c in connections:
+            if c.enabled:
+                src, dst = index[c.in_node.id], index[c.out_node.id]
+                incoming[dst].append((src, c.weight))
+                outgoing[src].append(dst)
+
+        # assign depths in topological order (kahn's algorithm)
+        depth = [0] * len(nodes)
+        pending = [len(incoming[i]) for i in range(len(nodes))]
+        queue = [i for i in range(len(nodes)) if pending[i] == 0]
+        for i in queue:
+            if nodes[i].node_type != 'input':
+                depth[i] = 1 + max((depth[src] for src, _ in incoming[i]), default=0)
+            for dst in outgoing[i]:
+                pending[dst] -= 1
+                if pending[dst] == 0:
+                    queue.append(dst)
+
+        if len(queue) != len(nodes):
+            raise ValueError('Network contains a cycle, recurrent networks have to be run with step()')
+
+        self.layers = []
+        for d in range(1, max(depth, default=0) + 1):
+            layer_nodes = [i for i in range(len(nodes)) if depth[i] == d]
+            self.layers.append(Layer(layer_nodes, [nodes[i] for i in layer_nodes], [incoming[i] for i in layer_nodes]))
+
+    def activate(self, inputs):
+        '''
+        runs the plan on a single input vector, or on a batch of them (one per row)
+        '''
+
+        inputs = np.asarray(inputs, dtype=float)
+        values = np.zeros(inputs.shape[:-1] + (self.num_values,))
+        values[..., self.input_idx] = inputs
+
+        for layer in self.layers:
+            x = values[..., layer.sources] @ layer.weights + layer.bias
+            for name, positions in layer.groups:
+                x[..., positions] = activation_functions[name](x[..., positions])
+            values[..., layer.nodes] = x
+
+        return values[..., self.output_idx]
+
+class Layer:
+    '''
+    all nodes of a single depth, along with the weights of their incoming connections.
+    weights are kept both as a dense (sources x nodes) matrix and as coordinate arrays
+    '''
+
+    def __init__(self, layer_nodes, nodes, incoming):
+        self.nodes = np.array(layer_nodes, dtype=np.intp)
+
+        # nodes without incoming connections are activated from zero, without their bias
+        self.bias = np.array([n.bias if inc else 0.0 for n, inc in zip(nodes, incoming)])
+
+        self.sources = np.array(sorted({src for inc in incoming for src, _ in inc}), dtype=np.intp)
+        source_pos = {src: i for i, src in enumerate(self.sources)}
+        self.src = np.array([src for inc in incoming for src, _ in inc], dtype=np.intp)
+        self.dst = np.array([pos for pos, inc in enumerate(incoming) for _ in inc], dtype=np.intp)
+        self.weight = np.array([w for inc in incoming for _, w in inc], dtype=float)
+
+        self.weights = np.zeros((len(self.sources), len(self.nodes)))
+        self.weights[np.array([source_pos[s] for s in self.src], dtype=np.intp), self.dst] = self.weight
+
+        # group nodes by activation function, so each function is applied once per layer
+        activations = [n.activation for n in nodes]
+        if len(set(activations)) == 1:
+            self.groups = [(activations[0], slice(None))]
+        else:
+            self.groups = [(name, np.array([i for i, a in enumerate(activations) if a == name], dtype=np.intp)) for name in sorted(set(activations))]
+
+class RecurrentPlan:
+    '''
+    execution plan for a network that may contain cycles, advanced one tick at a time
+    against a persistent state. nodes are updated layer by layer in a fixed order: a
+    connection from an earlier layer carries the value of the current tick, every other
+    (recurrent) connection the value of the previous tick. without cycles, a step gives
+    the same outputs as Plan.activate.
+
+    values are renumbered so the inputs come first, followed by each layer in turn
+    with its nodes sorted by activation function, so a step works on contiguous slices
+    '''
+
+    def __init__(self, nodes, connections):
+        index = {node.id: i for i, node in enumerate(nodes)}
+        incoming = [[] for _ in nodes]
+        for c in connections:
+            if c.enabled:
+                incoming[index[c.out_node.id]].append((index[c.in_node.id], c.weight))
+
+        # find the connections that close a cycle with a depth-first search (starting from
+        # the inputs), and leave them out when the nodes are layered by depth
+        outgoing = [[] for _ in nodes]
+        for i, inc in enumerate(incoming):
+            for src, _ in inc:
+                outgoing[src].append(i)
+        inputs = [i for i, n in enumerate(nodes) if n.node_type == 'input']
+        status = [0] * len(nodes) # 0 unseen, 1 on the stack, 2 done
+        back = set()
+        for root in inputs + list(range(len(nodes))):
+            if status[root]:
+                continue
+            status[root] = 1
+            stack = [(root, iter(outgoing[root]))]
+            while stack:
+                node, successors = stack[-1]
+                for dst in successors:
+                    if status[dst] == 1:
+                        back.add((node, dst))
+                    elif status[dst] == 0:
+                        status[dst] = 1
+                        stack.append((dst, iter(outgoing[dst])))
+                        break
+                else:
+                    status[node] = 2
+                    stack.pop()
+
+        # assign depths in topological order over the remaining connections (kahn's algorithm)
+        depth = [0] * len(nodes)
+        pending = [sum((src, i) not in back for src, _ in incoming[i]) for i in range(len(nodes))]
+        queue = [i for i in range(len(nodes)) if pending[i] == 0]
+        for i in queue:
+            if nodes[i].node_type != 'input':
+                depth[i] = 1 + max((depth[src] for src, _ in incoming[i] if (src, i) not in back), default=0)
+            for dst in outgoing[i]:
+                if (i, dst) not in back:
+                    pending[dst] -= 1
+                    if pending[dst] == 0:
+                        queue.append(dst)
+
+        order = [sorted((i for i in range(len(nodes)) if depth[i] == d), key=lambda i: nodes[i].activation) for d in range(1, max(depth, default=0) + 1)]
+        self.recurrent = any(depth[src] >= depth[i] for i in range(len(nodes)) for src, _ in incoming[i])
+
+        position = np.zeros(len(nodes), dtype=np.intp)
+        position[inputs + [i for layer in order for i in layer]] = np.arange(len(nodes))
+        self.num_values = len(nodes)
+        self.num_inputs = len(inputs)
+        self.input_idx = np.array(inputs, dtype=np.intp)
+        self.output_idx = position[[i for i, n in enumerate(nodes) if n.node_type == 'output']]
+
+        # (start, end, sources, weights, bias, [(activation, start, end)]) per layer
+        self.layers = []
+        start = self.num_inputs
+        for layer in order:
+            end = start + len(layer)
+            sources = np.array(sorted({position[src] for i in layer for src, _ in incoming[i]}), dtype=np.intp)
+            source_pos = {src: j for j, src in enumerate(sources)}
+            weights = np.zeros((len(sources), len(layer)))
+            for j, i in enumerate(layer):
+                for src, weight in incoming[i]:
+                    weights[source_pos[position[src]], j] += weight
+
+            # nodes without incoming connections are activated from zero, without their bias
+            bias = np.array([nodes[i].bias if incoming[i] else 0.0 for i in layer])
+
+            activations = [nodes[i].activation for i in layer]
+            bounds = [0] + [j for j in range(1, len(layer)) if activations[j] != activations[j - 1]] + [len(layer)]
+            groups = [(activations[a], start + a, start + b) for a, b in zip(bounds, bounds[1:]) if activations[a] != 'linear']
+            self.layers.append((start, end, sources, weights, bias, groups))
+            start = end
+
+    def allocate(self, shape=()):
+        '''
+        a zeroed state for the given leading (batch) shape: the value of every node,
+        plus the per-layer buffers a step gathers its sources into
+        '''
+
+        values = np.zeros(shape + (self.num_values,))
+        gathered = [np.zeros(shape + (len(sources),)) for _, _, sources, _, _, _ in self.layers]
+        return values, gathered
+
+    def step(self, inputs, state):
+        '''
+        advances the state by one tick, returning the outputs
+        '''
+
+        values, gathered = state
+        values[..., :self.num_inputs] = inputs
+
+        for (start, end, sources, weights, bias, groups), x_in in zip(self.layers, gathered):
+            np.take(values, sources, axis=-1, out=x_in)
+            x = values[..., start:end]
+            np.matmul(x_in, weights, out=x)
+            x += bias
+            for name, a, b in groups:
+                values[..., a:b] = activation_functions[name](values[..., a:b])
+
+        return values[..., self.output_idx]
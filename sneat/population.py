@@ -1,72 +1,94 @@
+import contextlib
+import gc
 import numpy as np
 import time
 from .species import Species
 from .config import get_config
 from .genome import Genome
+from .normalizer import SharedNormalizer
+
+# genetic distance coefficients
+C1 = C2 = 1.0 # excess and disjoint genes
+C3 = 0.6 # weight differences
+
+@contextlib.contextmanager
+def gc_paused():
+    '''
+    pauses the cyclic garbage collector. reproduction creates hundreds of thousands of
+    gene objects, and every so many allocations would trigger a collection that walks
+    the whole population - while none of them are part of a reference cycle
+    '''
+
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        yield
+    finally:
+        if enabled:
+            gc.enable()
 
 class Population:
-    def __init__(self):
-        self.config = get_config()
-        self.innovations = []
+    def __init__(self, initialize=True, config=None):
+        # a config passed in (see Config.override) takes the place of the one from the files
+        self.config = config or get_config()
+        self.innovations = {} # (in node id, out node id) -> innovation number
+        self.innovation_counter = 0
         self.genome_counter = 0
         self.species_counter = 0
         self.species = []
         self.generation = 0
-        self.compatibility_threshold = self.config.getfloat('Population', 'compatibility_threshold')
+        self.compatibility_threshold = self.config.population.compatibility_threshold
         self.best_genome_seen = None
+
+        # one set of input statistics for every genome, instead of one per genome
+        self.normalizer = None
+        if self.config.neural_network.use_normalizer and self.config.neural_network.shared_normalizer:
+            self.normalizer = SharedNormalizer(self.config.neural_network.num_inputs)
+
         self.callbacks = {
             'find_or_create_innovation': self.find_or_create_innovation,
             'get_next_genome_id': self.get_next_genome_id,
             'get_next_species_id': self.get_next_species_id,
-            'config': self.config
+            'config': self.config,
+            'normalizer': self.normalizer
         }
 
-        self.initialize()
+        # a population restored from a checkpoint brings its own genomes
+        if initialize:
+            self.initialize()
 
     @property
     def genomes(self):
         return [genome for species in self.species for genome in species.members]
 
     def initialize(self):
-        genomes = [g for g in [Genome(self.callbacks) for _ in range(self.config.getint('Population', 'population_size'))]]
+        genomes = [g for g in [Genome(self.callbacks) for _ in range(self.config.population.population_size)]]
         self.speciate(genomes)
 
+    @gc_paused()
     def reproduce(self):
-        elite_size = self.config.getint('Population', 'elite_size')
-        min_species_size = self.config.getint('Population', 'min_species_size')
-        population_size = self.config.getint('Population', 'population_size')
-        survival_threshold = self.config.getfloat('Population', 'survival_threshold')
+        elite_size = self.config.population.elite_size
+        min_species_size = self.config.population.min_species_size
+        population_size = self.config.population.population_size
+        survival_threshold = self.config.population.survival_threshold
+        min_species = self.config.evolution.min_species
+        max_stagnation = self.config.evolution.max_stagnation
 
         offspring = []
 
-        # normalize fitness scores
-        min_fitness = min(g.fitness for g in self.genomes)
-        max_fitness = max(g.fitness for g in self.genomes)
-        if max_fitness - min_fitness == 0:
-            max_fitness += 0.0001 # avoid division by zero
-        for g in self.genomes:
-            g.normalized_fitness = (g.fitness - min_fitness) / (max_fitness - min_fitness)
+        self.assign_adjusted_fitness()
 
+        # bump stagnation
         for s in self.species:
-
-            # bump stagnation
             if s.members[0].fitness > s.best_fitness:
                 s.best_fitness = s.members[0].fitness
                 s.stagnation = 0
             else:
                 s.stagnation += 1
 
-            # assign adjusted fitness scores
-            s_size = len(s.members)
-            for g in s.members:
-                g.adjusted_fitness = max(g.normalized_fitness / s_size, 0.0001) # avoid division by zero
-
-        # remove stagnant species
-        while len(self.species) > self.config.getint('Evolution', 'min_species'):
-            stagnant_species = [s for s in self.species if s.stagnation >= self.config.getint('Evolution', 'max_stagnation')]
-            stagnant_species = sorted(stagnant_species, key=lambda x: x.best_fitness, reverse=True)
-            if not stagnant_species:
-                break
+        # remove stagnant species, least fit first
+        stagnant_species = sorted([s for s in self.species if s.stagnation >= max_stagnation], key=lambda x: x.best_fitness, reverse=True)
+        while stagnant_species and len(self.species) > min_species:
             extinct = stagnant_species.pop()
             extinct.members = sorted(extinct.members, key=lambda x: x.fitness, reverse=True)
 
@@ -77,105 +99,236 @@ class Population:
             self.species.remove(extinct)
             print(f'[i] Species {extinct.id} went extinct due to stagnation')
 
-        # perform reproduction inside of each species
+        # copy the elite of every species as-is, and kill off the worst performing members
+        elites = []
         for s in self.species:
-            s_offspring = []
-
-            # copy elite as-is
             s.members.sort(key=lambda x: x.fitness, reverse=True)
             elite = s.members[:elite_size]
-            s_offspring.extend([g.clone() for g in elite])
-
-            # kill of worst performing members
+            elites.append([g.clone() for g in elite])
             if len(s.members) > min_species_size + len(elite):
                 s.members = s.members[:int(len(s.members) * survival_threshold + 1)]
 
-            # calculate allowed offspring
-            total_fitness = sum(g.adjusted_fitness for g in self.genomes)
-            s_fitness = sum(g.adjusted_fitness for g in s.members)
+        # each species gets offspring in proportion to the adjusted fitness of its survivors
+        species_fitness = [sum(g.adjusted_fitness for g in s.members) for s in self.species]
+        total_fitness = sum(species_fitness)
+
+        # perform reproduction inside of each species. parents are drawn species by species,
+        # then all children of the generation are bred and mutated in one batch
+        pairs = []
+        for s, s_offspring, s_fitness in zip(self.species, elites, species_fitness):
             allowed_offspring = (s_fitness / total_fitness) * population_size
             allowed_offspring = int(max(allowed_offspring, min_species_size))
 
             if len(s.members) <= 1:
                 continue
 
-            # breed the rest
-            total_adjusted_fitness = sum(g.adjusted_fitness for g in s.members)
-            selection_probabilities = [g.adjusted_fitness / total_adjusted_fitness for g in s.members]
-            while len(s_offspring) < allowed_offspring:
-                parent1 = np.random.choice(s.members, p=selection_probabilities)
-                parent2 = np.random.choice(s.members, p=selection_probabilities)
-                child = parent1.crossover(parent1, parent2)
-                child.mutate()
-                child.id = self.get_next_genome_id()
-                s_offspring.append(child)
-                
+            # draw both parents of every child at once, as indices into the members
+            selection_probabilities = np.array([g.adjusted_fitness for g in s.members]) / s_fitness
+            parents = np.random.choice(len(s.members), size=(max(allowed_offspring - len(s_offspring), 0), 2), p=selection_probabilities)
+            pairs.extend((s.members[i], s.members[j]) for i, j in parents.tolist())
+
             offspring.extend(s_offspring)
 
+        children = Genome.crossover_all(pairs)
+
         # add genomes if we're below the population size
-        while len(offspring) < population_size:
-            g = np.random.choice(offspring).clone()
-            g.mutate()
-            g.id = self.get_next_genome_id()
-            offspring.append(g)
+        missing = population_size - len(offspring) - len(children)
+        if missing > 0:
+            pool = offspring + children
+            children.extend(pool[i].clone() for i in np.random.randint(len(pool), size=missing).tolist())
+
+        Genome.mutate_all(children, self.callbacks)
+        for child in children:
+            child.id = self.get_next_genome_id()
+        offspring.extend(children)
 
 
         # re-speciate
         self.generation += 1
         self.speciate(offspring)
 
+        # the next generation is normalized with everything observed so far
+        if self.normalizer is not None:
+            self.normalizer.advance()
+
+        if self.config.population.retire_innovations:
+            self.retire_innovations()
+
+    def assign_adjusted_fitness(self):
+        '''
+        normalizes fitness scores across the population, then shares them within each species
+        '''
+
+        genomes = self.genomes
+        min_fitness = min(g.fitness for g in genomes)
+        max_fitness = max(g.fitness for g in genomes)
+        if max_fitness - min_fitness == 0:
+            max_fitness += 0.0001 # avoid division by zero
+        for g in genomes:
+            g.normalized_fitness = (g.fitness - min_fitness) / (max_fitness - min_fitness)
+
+        for s in self.species:
+            s_size = len(s.members)
+            for g in s.members:
+                g.adjusted_fitness = max(g.normalized_fitness / s_size, 0.0001) # avoid division by zero
+
+    def breed(self):
+        '''
+        breeds a single child for steady-state evolution. a species is picked in
+        proportion to its share of the adjusted fitness, and so are both parents within it
+        '''
+
+        self.assign_adjusted_fitness()
+        species_fitness = np.array([sum(g.adjusted_fitness for g in s.members) for s in self.species])
+        s = self.species[np.random.choice(len(self.species), p=species_fitness / species_fitness.sum())]
+
+        selection_probabilities = np.array([g.adjusted_fitness for g in s.members])
+        selection_probabilities /= selection_probabilities.sum()
+        parent1, parent2 = np.random.choice(len(s.members), size=2, p=selection_probabilities)
+
+        child = Genome.crossover(s.members[parent1], s.members[parent2])
+        child.mutate(self.callbacks)
+        child.id = self.get_next_genome_id()
+        return child
+
+    def insert(self, genome):
+        '''
+        adds a freshly evaluated genome to the closest compatible species (or founds a new one).
+        if the population is full, the genome with the lowest adjusted fitness is evicted first
+        '''
+
+        if len(self.genomes) >= self.config.population.population_size:
+            self.remove_worst()
+
+        distances = GeneticEncoding([genome] + [s.representative for s in self.species]).distances_to(0)[1:]
+        if len(distances) and distances.min() < self.compatibility_threshold:
+            self.species[int(np.argmin(distances))].add_member(genome)
+        else:
+            self.species.append(Species(genome, self.callbacks))
+
+    def remove_worst(self):
+        '''
+        evicts the genome with the lowest adjusted fitness, so crowded species shrink
+        before small ones do
+        '''
+
+        self.assign_adjusted_fitness()
+        worst = min(self.genomes, key=lambda g: (g.adjusted_fitness, g.fitness))
+        s = next(s for s in self.species if worst in s.members)
+        s.members.remove(worst)
+
+        if not s.members:
+            self.species.remove(s)
+        elif s.representative is worst:
+            s.representative = max(s.members, key=lambda g: g.fitness)
+
+    def advance_generation(self, in_flight=()):
+        '''
+        steady-state bookkeeping, run once every population_size evaluations:
+        bumps stagnation, removes stagnant species and adjusts the compatibility threshold.
+        in_flight are the children still being evaluated, whose innovations must survive
+        '''
+
+        self.generation += 1
+
+        for s in self.species:
+            best = max(g.fitness for g in s.members)
+            if best > s.best_fitness:
+                s.best_fitness = best
+                s.stagnation = 0
+            else:
+                s.stagnation += 1
+
+        # the population grows back as new children are inserted
+        stagnant_species = [s for s in self.species if s.stagnation >= self.config.evolution.max_stagnation]
+        stagnant_species = sorted(stagnant_species, key=lambda x: x.best_fitness, reverse=True)
+        while stagnant_species and len(self.species) > max(self.config.evolution.min_species, 1):
+            extinct = stagnant_species.pop()
+            self.species.remove(extinct)
+            print(f'[i] Species {extinct.id} went extinct due to stagnation')
+
+        self.adjust_compatibility_threshold()
+
+        if self.normalizer is not None:
+            self.normalizer.advance()
+
+        if self.config.population.retire_innovations:
+            self.retire_innovations(in_flight)
+
     def speciate(self, genomes=None):
         unspeciated = genomes or self.genomes
         new_reps = {}
         new_members = {}
 
-        # find a representative for each species
-        for s in self.species:
-            candidates = []
-            for g in unspeciated:
-                d = self.measure_genetic_distance(s.representative, g)
-                candidates.append((d, g))
-            
-            _, new_rep = min(candidates, key=lambda x: x[0])
-            new_reps[s.id] = new_rep
-            new_members[s.id] = [new_rep]
-            unspeciated.remove(new_rep)
-
-        while unspeciated:
-            g = unspeciated.pop()
-            candidates = []
-            
-            for sid, rep in new_reps.items():
-                d = self.measure_genetic_distance(rep, g)
-                if d < self.compatibility_threshold:
-                    candidates.append((d, sid))
+        # encode all genomes and the old representatives once, to measure distances in batches
+        encoding = GeneticEncoding(unspeciated + [s.representative for s in self.species])
+        remaining = np.ones(len(unspeciated), dtype=bool)
+        rep_rows = []
 
-            if candidates:
-                d, sid = min(candidates, key=lambda x: x[0])
+        # find a representative for each species
+        for i, s in enumerate(self.species):
+            distances = encoding.distances_to(len(unspeciated) + i)[:len(unspeciated)]
+            distances[~remaining] = np.inf
+            r = int(np.argmin(distances))
+            remaining[r] = False
+            rep_rows.append(r)
+            new_reps[s.id] = unspeciated[r]
+            new_members[s.id] = [unspeciated[r]]
+
+        # distances from every genome to every representative, with a column added per new species
+        sids = list(new_reps.keys())
+        distances = np.zeros((len(encoding), 0))
+        if rep_rows:
+            distances = np.column_stack([encoding.distances_to(r) for r in rep_rows])
+
+        for i in reversed(np.flatnonzero(remaining)):
+            g = unspeciated[i]
+            candidates = distances[i] < self.compatibility_threshold
+
+            if candidates.any():
+                sid = sids[int(np.argmin(np.where(candidates, distances[i], np.inf)))]
                 new_members[sid].append(g)
             else:
                 new_species = Species(g, self.callbacks)
                 new_reps[new_species.id] = g
                 new_members[new_species.id] = [g]
                 self.species.append(new_species)
+                sids.append(new_species.id)
+                distances = np.column_stack([distances, encoding.distances_to(i)])
 
         for s in self.species:
             s.members = new_members[s.id]
             s.representative = new_reps[s.id]
 
-        # adjust compatibility threshold
-        if len(self.species) < self.config.getint('Evolution', 'target_species'):
+        self.adjust_compatibility_threshold()
+
+    def adjust_compatibility_threshold(self):
+        if len(self.species) < self.config.evolution.target_species:
             self.compatibility_threshold *= 0.97
         else:
-            self.compatibility_threshold = self.config.getfloat('Population', 'compatibility_threshold')
+            self.compatibility_threshold = self.config.population.compatibility_threshold
             
 
     def find_or_create_innovation(self, in_node, out_node):
-        innovation = next((i for i in self.innovations if i.in_node.id == in_node.id and i.out_node.id == out_node.id), None)
-        if not innovation:
-            innovation = Innovation(len(self.innovations), in_node, out_node)
-            self.innovations.append(innovation)
-        return innovation.innovation_number
+        key = (in_node.id, out_node.id)
+        innovation_number = self.innovations.get(key)
+        if innovation_number is None:
+            innovation_number = self.innovation_counter
+            self.innovation_counter += 1
+            self.innovations[key] = innovation_number
+        return innovation_number
+
+    def retire_innovations(self, extra=()):
+        '''
+        forgets innovations that no genome carries any more - neither the population,
+        the best genome seen nor the extra genomes (children out for evaluation, say).
+        innovation numbers are never reused, so a retired connection that reappears
+        later simply gets a fresh number
+        '''
+
+        genomes = self.genomes + list(extra) + ([self.best_genome_seen] if self.best_genome_seen else [])
+        in_use = {c.innovation_number for g in genomes for c in g.network.connections}
+        self.innovations = {k: v for k, v in self.innovations.items() if v in in_use}
 
     def get_next_genome_id(self):
         self.genome_counter += 1
@@ -187,9 +340,7 @@ class Population:
 
     @staticmethod
     def measure_genetic_distance(g1, g2):
-        # constants
-        c1 = c2 = 1.0 # excess and disjoint genes
-        c3 = 0.6 # weight differences
+        c1, c2, c3 = C1, C2, C3
 
         # node distances
         node_distance = 0.0
@@ -226,8 +377,66 @@ class Population:
 
         return node_distance + connection_distance
 
-class Innovation:
-    def __init__(self, innovation_number, in_node, out_node):
-        self.innovation_number = innovation_number
-        self.in_node = in_node
-        self.out_node = out_node
\ No newline at end of file
+class GeneticEncoding:
+    '''
+    sparse encoding of many genomes at once: their node ids and their connections'
+    innovation numbers and weights, each concatenated along with the index of the
+    genome they belong to. distances from every encoded genome to one of them then
+    come out of a few numpy calls, using the same formula as measure_genetic_distance
+    '''
+
+    def __init__(self, genomes):
+        networks = [g.network for g in genomes]
+        self.node_counts = np.array([len(net.nodes) for net in networks], dtype=np.intp)
+        self.conn_counts = np.array([len(net.connections) for net in networks], dtype=np.intp)
+        self.node_ptr = np.concatenate([[0], np.cumsum(self.node_counts)])
+        self.conn_ptr = np.concatenate([[0], np.cumsum(self.conn_counts)])
+        self.node_owner = np.repeat(np.arange(len(networks)), self.node_counts)
+        self.conn_owner = np.repeat(np.arange(len(networks)), self.conn_counts)
+
+        self.node_ids = np.array([n.id for net in networks for n in net.nodes], dtype=np.intp)
+        self.innovations = np.array([c.innovation_number for net in networks for c in net.connections], dtype=np.intp)
+        self.weights = np.array([c.weight for net in networks for c in net.connections], dtype=float)
+
+        # dense lookup tables, filled in for one genome at a time
+        self.node_lookup = np.zeros(self.node_ids.max(initial=0) + 1, dtype=bool)
+        self.conn_lookup = np.zeros(self.innovations.max(initial=0) + 1, dtype=bool)
+        self.weight_lookup = np.zeros(len(self.conn_lookup))
+
+    def __len__(self):
+        return len(self.node_counts)
+
+    def distances_to(self, r):
+        '''
+        returns the genetic distance from every encoded genome to the r'th one
+        '''
+
+        n = len(self)
+        c1, c2, c3 = C1, C2, C3
+
+        # node distances
+        nodes = self.node_ids[self.node_ptr[r]:self.node_ptr[r + 1]]
+        self.node_lookup[nodes] = True
+        shared_nodes = np.bincount(self.node_owner, weights=self.node_lookup[self.node_ids], minlength=n)
+        self.node_lookup[nodes] = False
+
+        # excess and disjoint genes are counted the same way as in measure_genetic_distance
+        different_nodes = self.node_counts + self.node_counts[r] - 2 * shared_nodes
+        largest = np.maximum(self.node_counts, self.node_counts[r])
+        node_distance = np.divide(c1 * different_nodes + c2 * different_nodes, largest, out=np.zeros(n), where=largest > 0)
+
+        # connection distances
+        innovations = self.innovations[self.conn_ptr[r]:self.conn_ptr[r + 1]]
+        self.conn_lookup[innovations] = True
+        self.weight_lookup[innovations] = self.weights[self.conn_ptr[r]:self.conn_ptr[r + 1]]
+        matching = self.conn_lookup[self.innovations]
+        shared_connections = np.bincount(self.conn_owner, weights=matching, minlength=n)
+        weight_diff = np.bincount(self.conn_owner, weights=np.abs(self.weights - self.weight_lookup[self.innovations]) * matching, minlength=n)
+        self.conn_lookup[innovations] = False
+        self.weight_lookup[innovations] = 0.0
+
+        different_connections = self.conn_counts + self.conn_counts[r] - 2 * shared_connections
+        largest = np.maximum(self.conn_counts, self.conn_counts[r])
+        connection_distance = np.divide(c1 * different_connections + c2 * different_connections + c3 * weight_diff, largest, out=np.zeros(n), where=largest > 0)
+
+        return node_distance + connection_distance
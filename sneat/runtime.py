@@ -0,0 +1,112 @@
+'''
+a minimal inference runtime for networks exported with sneat.export. it depends on
+numpy alone, so this file can be copied into a service that doesn't install sneat
+'''
+
+import numpy as np
+
+FORMAT_VERSION = 1
+
+# must match sneat.config.activation_functions
+ACTIVATIONS = {
+    'sigmoid': lambda x: 1 / (1 + np.exp(-np.clip(x, -20, 20))),
+    'tanh': lambda x: np.tanh(x),
+    'relu': lambda x: np.maximum(0, x),
+    'leaky_relu': lambda x: np.maximum(0.01 * x, x),
+    'linear': lambda x: x,
+    'gaussian': lambda x: np.exp(-np.clip(x, -20, 20) ** 2),
+    'sin': lambda x: np.sin(x),
+    'cos': lambda x: np.cos(x),
+}
+
+class FrozenNetwork:
+    '''
+    a fixed, exported network. activate() takes a single input vector, activate_batch()
+    a matrix with one input vector per row. buffers are allocated once (and once per
+    batch size) and reused across calls
+    '''
+
+    def __init__(self, arrays):
+        if int(arrays['version']) != FORMAT_VERSION:
+            raise ValueError(f'Unsupported network format version {int(arrays['version'])}')
+
+        names = [str(name) for name in arrays['activation_names']]
+        unknown = set(names) - ACTIVATIONS.keys()
+        if unknown:
+            raise ValueError(f'Unknown activation functions: {', '.join(sorted(unknown))}')
+
+        self.num_inputs = int(arrays['num_inputs'])
+        self.num_values = int(arrays['num_values'])
+        self.output_idx = arrays['output_idx']
+        self.mean = arrays['normalizer_mean'] if 'normalizer_mean' in arrays else None
+        self.std = arrays['normalizer_std'] if 'normalizer_std' in arrays else None
+
+        # each layer fills a contiguous range of values, with its nodes sorted by activation
+        # function: (start, end, sources, weights, bias, [(activation, start, end)]) per layer
+        self.layers = []
+        layer_ptr, source_ptr, weight_ptr = arrays['layer_ptr'], arrays['source_ptr'], arrays['weight_ptr']
+        for i in range(len(layer_ptr) - 1):
+            start, end = int(layer_ptr[i]), int(layer_ptr[i + 1])
+            sources = arrays['sources'][source_ptr[i]:source_ptr[i + 1]]
+            weights = arrays['weights'][weight_ptr[i]:weight_ptr[i + 1]].reshape(len(sources), end - start)
+            bias = arrays['bias'][start - self.num_inputs:end - self.num_inputs]
+            codes = arrays['activation'][start:end]
+            bounds = [0] + [j for j in range(1, len(codes)) if codes[j] != codes[j - 1]] + [len(codes)]
+            groups = [(ACTIVATIONS[names[codes[a]]], start + a, start + b) for a, b in zip(bounds, bounds[1:]) if names[codes[a]] != 'linear']
+            self.layers.append((start, end, sources, weights, bias, groups))
+
+        self.single = self.allocate(())
+        self.batch = None
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path, allow_pickle=False) as archive:
+            return cls({name: archive[name] for name in archive.files})
+
+    def allocate(self, shape):
+        '''
+        the value buffer and per-layer gather buffers for inputs of the given leading (batch) shape
+        '''
+
+        values = np.zeros(shape + (self.num_values,))
+        gathered = [np.zeros(shape + (len(sources),)) for _, _, sources, _, _, _ in self.layers]
+        return values, gathered
+
+    def run(self, inputs, buffers):
+        values, gathered = buffers
+        if self.mean is not None:
+            inputs = (inputs - self.mean) / self.std
+        values[..., :self.num_inputs] = inputs
+
+        for (start, end, sources, weights, bias, groups), x_in in zip(self.layers, gathered):
+            np.take(values, sources, axis=-1, out=x_in)
+            x = values[..., start:end]
+            np.matmul(x_in, weights, out=x)
+            x += bias
+            for fn, a, b in groups:
+                values[..., a:b] = fn(values[..., a:b])
+
+        return values[..., self.output_idx]
+
+    def activate(self, inputs):
+        inputs = np.asarray(inputs, dtype=float)
+        if inputs.shape != (self.num_inputs,):
+            raise ValueError(f'Wrong input shape. Expected ({self.num_inputs},), but got {inputs.shape}.')
+        return self.run(inputs, self.single)
+
+    def activate_batch(self, inputs):
+        inputs = np.asarray(inputs, dtype=float)
+        if inputs.ndim != 2 or inputs.shape[1] != self.num_inputs:
+            raise ValueError(f'Wrong input shape. Expected (batch, {self.num_inputs}), but got {inputs.shape}.')
+
+        # keep the buffers of the last batch size, serving usually sticks to one
+        if self.batch is None or self.batch[0].shape[0] != len(inputs):
+            self.batch = self.allocate((len(inputs),))
+        return self.run(inputs, self.batch)
+
+def load(path):
+    '''
+    loads a network exported with sneat.export.export_genome
+    '''
+
+    return FrozenNetwork.load(path)
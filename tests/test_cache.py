@@ -0,0 +1,49 @@
+'''
+the fitness cache in front of a stand-in evaluator
+'''
+
+import numpy as np
+from sneat.cache import FitnessCache, CachedEvaluator
+from sneat.evaluator import RacedFitness
+from sneat.population import Population
+
+class CountingEvaluator:
+    '''
+    evaluates genomes with the given function, counting the evaluations
+    '''
+
+    num_workers = 1
+
+    def __init__(self, fitness):
+        self.fitness = fitness
+        self.evaluated = []
+
+    def evaluate(self, genomes):
+        self.evaluated += genomes
+        return [self.fitness(g) for g in genomes]
+
+def copies(count):
+    np.random.seed(0)
+    genome = Population().genomes[0]
+    return [genome.clone() for _ in range(count)]
+
+def test_exact_mode_evaluates_copies_once():
+    evaluator = CountingEvaluator(lambda g: 1.0)
+    cached = CachedEvaluator(evaluator, FitnessCache(mode='exact'))
+    assert cached.evaluate(copies(4)) == [1.0] * 4
+    assert len(evaluator.evaluated) == 1
+
+def test_average_mode_evaluates_every_copy():
+    samples = iter([1.0, 2.0, 3.0, 6.0])
+    evaluator = CountingEvaluator(lambda g: next(samples))
+    cache = FitnessCache(mode='average')
+    fitness = CachedEvaluator(evaluator, cache).evaluate(copies(4))
+    assert len(evaluator.evaluated) == 4
+    assert fitness[-1] == 3.0 and list(cache.entries.values()) == [(3.0, 4)]
+
+def test_raced_fitness_is_not_cached():
+    for mode in ('exact', 'average'):
+        cache = FitnessCache(mode=mode)
+        evaluator = CountingEvaluator(lambda g: RacedFitness(0.5))
+        assert CachedEvaluator(evaluator, cache).evaluate(copies(2)) == [0.5, 0.5]
+        assert len(cache) == 0
@@ -0,0 +1,94 @@
+'''
+the distributed backend over loopback, with the coordinator in the test process and
+workers in local processes
+'''
+
+import functools
+import multiprocessing as mp
+import socket
+import time
+import pytest
+from sneat.distributed import DistributedEvaluator, RemoteError, run_worker
+from sneat.population import Population
+
+AUTHKEY = b'test'
+TIMEOUT = 1.0 # seconds of silence before a worker's tasks are re-queued
+
+def fitness(genome):
+    return float(genome.id)
+
+def poisoned_fitness(genome, poison_id):
+    if genome.id == poison_id:
+        raise RuntimeError(f'poisoned genome {genome.id}')
+    return float(genome.id)
+
+def hanging_fitness(genome, started):
+    started.set()
+    time.sleep(3600)
+
+def free_address():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return f'127.0.0.1:{s.getsockname()[1]}'
+
+def start_worker(fitness_function, address):
+    worker = mp.get_context('spawn').Process(target=run_worker, args=(fitness_function, address, AUTHKEY), kwargs={'poll_interval': 0.1}, daemon=True)
+    worker.start()
+    return worker
+
+@pytest.fixture
+def coordinator():
+    address = free_address()
+    evaluator = DistributedEvaluator(address, authkey=AUTHKEY, timeout=TIMEOUT, num_workers=3)
+    workers = []
+    yield evaluator, address, workers
+    evaluator.close()
+    for worker in workers:
+        worker.kill()
+        worker.join()
+
+@pytest.fixture
+def genomes():
+    return Population().genomes[:12]
+
+def test_evaluates_on_several_workers(coordinator, genomes):
+    evaluator, address, workers = coordinator
+    workers += [start_worker(fitness, address) for _ in range(3)]
+
+    assert evaluator.evaluate(genomes) == [float(g.id) for g in genomes]
+
+def test_requeues_the_task_of_a_killed_worker(coordinator, genomes):
+    evaluator, address, workers = coordinator
+    started = mp.get_context('spawn').Event()
+    hanging = start_worker(functools.partial(hanging_fitness, started=started), address)
+    workers.append(hanging)
+
+    evaluator.submit(genomes[0])
+    assert started.wait(10)
+    hanging.kill()
+    hanging.join()
+
+    # the lease runs out and the task goes to the next worker that asks
+    workers.append(start_worker(fitness, address))
+    genome, result = evaluator.next_result()
+    assert genome is genomes[0] and result == float(genomes[0].id)
+
+def test_poisoned_task_fails_once_without_killing_workers(coordinator, genomes):
+    evaluator, address, workers = coordinator
+    poison_id = genomes[5].id
+    workers += [start_worker(functools.partial(poisoned_fitness, poison_id=poison_id), address) for _ in range(2)]
+
+    with pytest.raises(RemoteError, match=f'poisoned genome {poison_id}'):
+        evaluator.evaluate(genomes)
+
+    # the failed task isn't handed out again, and the workers carry on with new ones
+    time.sleep(3 * TIMEOUT)
+    assert all(worker.is_alive() for worker in workers)
+    healthy = [g for g in genomes if g.id != poison_id]
+    assert evaluator.evaluate(healthy) == [float(g.id) for g in healthy]
+
+def test_refuses_default_authkey_beyond_loopback():
+    with pytest.raises(ValueError, match='default authkey'):
+        DistributedEvaluator('0.0.0.0:5555')
+    with pytest.raises(ValueError, match='default authkey'):
+        run_worker(fitness, '0.0.0.0:5555')
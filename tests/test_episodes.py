@@ -0,0 +1,30 @@
+'''
+episode evaluation on a gymnasium vector environment
+'''
+
+import numpy as np
+import pytest
+from sneat.config import get_config
+from sneat.population import Population
+
+gym = pytest.importorskip('gymnasium')
+from sneat.episodes import make_envs, evaluate_episodes, clear_autoreset
+
+@pytest.fixture
+def genome():
+    np.random.seed(0)
+    config = get_config().override({'NeuralNetwork': {'num_inputs': 4, 'num_outputs': 2}})
+    return Population(config=config).genomes[0]
+
+def test_evaluations_reuse_envs_independently(genome):
+    # episodes that ended in the first evaluation must not be reset again in the second
+    envs = make_envs('CartPole-v1', 4)
+    first = evaluate_episodes(genome, envs, seed=0)
+    assert evaluate_episodes(genome, envs, seed=0) == first
+    assert evaluate_episodes(genome, make_envs('CartPole-v1', 4), seed=0) == first
+
+def test_clear_autoreset_fails_loudly_without_flags():
+    envs = make_envs('CartPole-v1', 2)
+    del envs._autoreset_envs
+    with pytest.raises(RuntimeError, match='autoreset'):
+        clear_autoreset(envs)
@@ -0,0 +1,24 @@
+'''
+importing sneat (or the modules evaluation workers load) stays free of the heavy optional dependencies
+'''
+
+import subprocess
+import sys
+import pytest
+
+HEAVY_MODULES = ['matplotlib', 'networkx', 'tabulate', 'tqdm', 'gymnasium']
+
+def imported_modules(code):
+    # run in a fresh interpreter, as anything this test process imported would count
+    output = subprocess.check_output([sys.executable, '-c', f'import sys; {code}; print(",".join(sorted(sys.modules)))'], text=True)
+    return set(output.strip().split(','))
+
+@pytest.mark.parametrize('module', ['sneat', 'sneat.genome', 'sneat.evaluator', 'sneat.runtime', 'sneat.evolve'])
+def test_no_heavy_modules(module):
+    assert not imported_modules(f'import {module}') & set(HEAVY_MODULES)
+
+def test_evolve_stays_a_function():
+    import sneat.evolve
+    from sneat import evolve, Population
+    assert callable(evolve) and not isinstance(evolve, type(sneat))
+    assert isinstance(Population, type)
@@ -0,0 +1,65 @@
+'''
+innovation numbers stay consistent when retire_innovations is on
+'''
+
+import collections
+import numpy as np
+from sneat.config import get_config
+from sneat.evolve import evolve_steady_state
+from sneat.population import Population
+
+def conflicting_innovations(genomes):
+    '''
+    the (in node, out node) pairs that carry more than one innovation number
+    '''
+
+    numbers = collections.defaultdict(set)
+    for g in genomes:
+        for c in g.network.connections:
+            numbers[(c.in_node.id, c.out_node.id)].add(c.innovation_number)
+    return {pair: n for pair, n in numbers.items() if len(n) > 1}
+
+class QueueEvaluator:
+    '''
+    evaluates in the test process, handing results back in the order genomes were
+    submitted - so num_workers children are always out for evaluation. checks the
+    genomes alive at the time (population, best genome and children in flight)
+    before every result
+    '''
+
+    def __init__(self, pop, num_workers):
+        self.pop = pop
+        self.num_workers = num_workers
+        self.queue = collections.deque()
+        self.checks = 0
+
+    def evaluate(self, genomes):
+        return [np.random.uniform(0, 10) for _ in genomes]
+
+    def submit(self, genome):
+        self.queue.append(genome)
+
+    def next_result(self):
+        alive = self.pop.genomes + list(self.queue) + [g for g in [self.pop.best_genome_seen] if g is not None]
+        assert conflicting_innovations(alive) == {}
+        self.checks += 1
+        return self.queue.popleft(), np.random.uniform(0, 10)
+
+    def terminate(self):
+        pass
+
+def test_steady_state_keeps_innovations_of_children_in_flight(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path) # the winner is saved to the working directory
+    np.random.seed(0)
+    config = get_config().override({
+        'Population': {'population_size': 20, 'retire_innovations': True},
+        'NeuralNetwork': {'num_inputs': 3, 'num_outputs': 2},
+        'MutationRates': {'add_node': 0.4, 'remove_node': 0.4}, # connections come and go often
+        'Evolution': {'checkpoint_interval': 0},
+    })
+    pop = Population(config=config)
+    evaluator = QueueEvaluator(pop, num_workers=20)
+
+    evolve_steady_state(pop, evaluator, max_generations=30, max_fitness=float('inf'))
+    assert evaluator.checks > 0
+    assert len(pop.innovations) < pop.innovation_counter # some innovations were retired
@@ -0,0 +1,33 @@
+'''
+the racing threshold, published from the fitness of completed genomes
+'''
+
+from sneat.evaluator import Racing, RacedFitness, run_fitness_function
+
+class Threshold:
+    value = float('-inf')
+
+def test_threshold_ignores_raced_fitness():
+    threshold = Threshold()
+    racing = Racing(lambda value: setattr(threshold, 'value', value), percentile=50, min_samples=4)
+    for fitness in [10.0, 20.0, 30.0, 40.0]:
+        racing.record(fitness)
+    assert threshold.value == 25.0
+
+    # genomes stopped early with a low fitness so far leave the threshold where it was
+    for _ in range(10):
+        racing.record(RacedFitness(1.0))
+    assert threshold.value == 25.0
+    assert list(racing.completed) == [10.0, 20.0, 30.0, 40.0]
+
+def test_stopped_genome_returns_raced_fitness():
+    def fitness(genome):
+        for step in range(10):
+            yield step, 15 - step
+        return 100.0
+
+    threshold = Threshold()
+    assert type(run_fitness_function(fitness, None, threshold)) is float
+    threshold.value = 12.5
+    result = run_fitness_function(fitness, None, threshold)
+    assert isinstance(result, RacedFitness) and result == 3.0
@@ -0,0 +1,84 @@
+'''
+the batched genetic distances and speciation against the scalar measure_genetic_distance
+'''
+
+import pickle
+import numpy as np
+import pytest
+from sneat.config import get_config
+from sneat.population import Population, GeneticEncoding
+from sneat.species import Species
+
+def scalar_speciate(pop, genomes):
+    '''
+    speciation one distance at a time, as it was done before GeneticEncoding
+    '''
+
+    unspeciated = list(genomes)
+    new_reps = {}
+    new_members = {}
+
+    for s in pop.species:
+        _, new_rep = min(((pop.measure_genetic_distance(s.representative, g), g) for g in unspeciated), key=lambda x: x[0])
+        new_reps[s.id] = new_rep
+        new_members[s.id] = [new_rep]
+        unspeciated.remove(new_rep)
+
+    while unspeciated:
+        g = unspeciated.pop()
+        candidates = [(d, sid) for sid, rep in new_reps.items() if (d := pop.measure_genetic_distance(rep, g)) < pop.compatibility_threshold]
+        if candidates:
+            _, sid = min(candidates, key=lambda x: x[0])
+            new_members[sid].append(g)
+        else:
+            new_species = Species(g, pop.callbacks)
+            new_reps[new_species.id] = g
+            new_members[new_species.id] = [g]
+            pop.species.append(new_species)
+
+    for s in pop.species:
+        s.members = new_members[s.id]
+        s.representative = new_reps[s.id]
+
+def species_layout(pop):
+    return {s.id: (s.representative.id, [g.id for g in s.members]) for s in pop.species}
+
+@pytest.fixture(scope='module')
+def evolved():
+    '''
+    a population that went through a few generations of mutation, with random fitness
+    '''
+
+    np.random.seed(0)
+    config = get_config().override({'Population': {'population_size': 80}, 'NeuralNetwork': {'num_inputs': 4, 'num_outputs': 2}})
+    pop = Population(config=config)
+    for _ in range(6):
+        for g in pop.genomes:
+            g.fitness = np.random.uniform(0, 10)
+        pop.reproduce()
+    return pop
+
+def test_distances_match_scalar(evolved):
+    genomes = evolved.genomes
+
+    # include a genome without any connections
+    bare = genomes[0].clone()
+    bare.network.connections = []
+    genomes = genomes + [bare]
+
+    encoding = GeneticEncoding(genomes)
+    for r in range(len(genomes)):
+        expected = [Population.measure_genetic_distance(g, genomes[r]) for g in genomes]
+        np.testing.assert_allclose(encoding.distances_to(r), expected, rtol=1e-12, atol=1e-12)
+
+# a lower threshold makes genomes found new species along the way
+@pytest.mark.parametrize('threshold_scale', [1.0, 0.3])
+def test_speciate_matches_scalar(evolved, threshold_scale):
+    batched, scalar = pickle.loads(pickle.dumps(evolved)), pickle.loads(pickle.dumps(evolved))
+    assert len(batched.species) > 1
+    for pop in (batched, scalar):
+        pop.compatibility_threshold *= threshold_scale
+
+    batched.speciate(batched.genomes)
+    scalar_speciate(scalar, scalar.genomes)
+    assert species_layout(batched) == species_layout(scalar)